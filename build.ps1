@@ -33,6 +33,9 @@ if (Test-Path (Join-Path $templatePath ".env")) {
     Copy-Item -Path (Join-Path $templatePath ".env") -Destination $tempDir
 }
 
+# Copy .gitignore file
+Copy-Item -Path (Join-Path $templatePath ".gitignore") -Destination $tempDir
+
 Compress-Archive -Path (Join-Path $tempDir "*") -DestinationPath "assets\project.zip" -Force
 Remove-Item -Path $tempDir -Recurse -Force
 
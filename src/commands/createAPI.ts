@@ -71,6 +71,51 @@ export async function getParameters(moduleBase: string): Promise<Record<string,
         result['id-type'] = idType;
     }
 
+    // 4. select pagination mode, key = pagination
+    const paginationOptions = [
+        { label: 'Page Index', description: 'page_index/page_size with total count', value: 'offset' },
+        { label: 'Cursor', description: 'keyset pagination, constant cost for deep pages', value: 'cursor' }
+    ];
+    const paginationMode = await vscode.window.showQuickPick(paginationOptions, {
+        placeHolder: 'Select pagination mode for list API'
+    });
+    if (!paginationMode) {
+        throw new Error('Pagination mode selection cancelled');
+    }
+    if (paginationMode.value === 'cursor') {
+        result['pagination'] = 'CursorPagination';
+        result['pagination-data'] = 'CursorPaginationData';
+        result['list-method'] = 'cursor_list';
+    } else {
+        result['pagination'] = 'Pagination';
+        result['pagination-data'] = 'PaginationData';
+        result['list-method'] = 'list';
+    }
+
+    // 5. select optional APIs, key = extra-apis
+    // bulk/export/cache 对应 assets 下的 api.<value>.template, etag 只修改 get/list 接口
+    const extraOptions = [
+        { label: 'Bulk', description: 'bulk create/update/delete in multi-row statements', value: 'bulk' },
+        { label: 'Export', description: 'stream all filtered rows as NDJSON or CSV', value: 'export' },
+        { label: 'Cache', description: 'read-through entity cache for get by id', value: 'cache' },
+        { label: 'ETag', description: 'answer If-None-Match with 304 on get and list', value: 'etag' }
+    ];
+    const extras = await vscode.window.showQuickPick(extraOptions, {
+        placeHolder: 'Select optional APIs (press Enter to skip)',
+        canPickMany: true
+    });
+    if (!extras) {
+        throw new Error('Optional API selection cancelled');
+    }
+    result['extra-apis'] = extras.map(opt => opt.value).join(',');
+    if (extras.some(opt => opt.value === 'etag')) {
+        result['etag-param'] = ', etag: ETag';
+        result['etag-arg'] = ', etag=etag';
+    } else {
+        result['etag-param'] = '';
+        result['etag-arg'] = '';
+    }
+
     if (result['auth-type'] === 'root') {
         result['depends'] = ', dependencies=[Depends(get_root_info)]';
     } else if (result['auth-type'] === 'login') {
@@ -91,12 +136,44 @@ export async function cmdCreateAPI(context: vscode.ExtensionContext, uri: vscode
         const apiFile = path.join(moduleBase, 'api.py');
         // 判断apiFile是否存在，否则抛出异常
 
+        const extras = parameters['extra-apis'] ? parameters['extra-apis'].split(',') : [];
+
+        // core names required by optional features, checked before appending templates
+        const coreNames: string[] = ['Fields'];
+        if (parameters['pagination'] === 'CursorPagination') {
+            coreNames.push('CursorPagination', 'CursorPaginationData');
+        }
+        if (extras.includes('bulk')) {
+            coreNames.push('BulkResult', 'BulkUpdateItem');
+        }
+        if (extras.includes('export')) {
+            coreNames.push('ExportFormat', 'export_response');
+        }
+        if (extras.includes('cache')) {
+            coreNames.push('entity_cache');
+        }
+        if (extras.includes('etag')) {
+            coreNames.push('ETag');
+        }
+        // the module template already imports some of them, e.g. Fields
+        const importedCoreNames = tools.importedNames(apiFile, 'core');
+        const missingCoreNames = coreNames.filter(name => !importedCoreNames.has(name));
+        const missingImports = missingCoreNames.length > 0 ? [`from core import ${missingCoreNames.join(', ')}`] : [];
+
+        // optional APIs go first, so fixed paths like /export are matched before /{item_id}
+        for (const extra of extras.filter(extra => extra !== 'etag')) {
+            tools.appendFromTemplateFile(context, `api.${extra}.template`, apiFile);
+        }
         tools.appendFromTemplateFile(context, 'api.template', apiFile);
         tools.renderFile(apiFile, parameters);
 
         const schema = parameters['schema-class'];
 
-        const importData: string = `from .schema import ${schema}, ${schema}Create, ${schema}Read, ${schema}Update\n` + `from .filter import ${schema}Filter`;
+        const importData: string = [
+            ...missingImports,
+            `from .schema import ${schema}, ${schema}Create, ${schema}Read, ${schema}Update`,
+            `from .filter import ${schema}Filter`
+        ].join('\n');
         tools.appendImports(apiFile, importData);
 
         vscode.window.showInformationMessage('API created successfully');
@@ -130,7 +130,9 @@ async function installDependencies(workspacePath: string) {
         'fastapi-filter',
         'PyJWT',
         'pwdlib[argon2]',
-        "taskiq"
+        "taskiq",
+        'zstandard',
+        'brotli'
     ];
 
     const cmd = `uv add ${dependencies.join(' ')}`;
@@ -186,7 +188,19 @@ async function configureAlembic(projectBase: string, parameters: Record<string,
     if (fs.existsSync(envPyPath)) {
         try {
             const metaConfig: Record<string, string> = {
-                "target_metadata = None": "target_metadata = SQLModel.metadata"
+                "target_metadata = None": "target_metadata = SQLModel.metadata",
+                // `python main.py migrate` runs alembic in-process and shares its connection
+                "    connectable = engine_from_config(": [
+                    '    connection = config.attributes.get("connection")',
+                    '    if connection is not None:',
+                    '        # Shared by `python main.py migrate`, keep in step with the configure below',
+                    '        context.configure(connection=connection, target_metadata=target_metadata)',
+                    '        with context.begin_transaction():',
+                    '            context.run_migrations()',
+                    '        return',
+                    '',
+                    '    connectable = engine_from_config(',
+                ].join('\n')
             };
             tools.replaceFileContent(envPyPath, metaConfig);
             tools.appendFileByTag(envPyPath, "from alembic import context", "from sqlmodel import SQLModel\n### auto generate start ###\n# ...\n### auto generate end ###\n");
@@ -303,6 +303,32 @@ export function fileContains(filePath: string, text: string): boolean {
     return content.includes(text);
 }
 
+/**
+ * Names a python file imports from a module with `from <module> import ...`
+ * @param filePath file path
+ * @param moduleName module name, e.g. core
+ * @returns imported names, as bound in the file (aliases included)
+ */
+export function importedNames(filePath: string, moduleName: string): Set<string> {
+    const names = new Set<string>();
+    if (!fs.existsSync(filePath)) {
+        return names;
+    }
+    const content = fs.readFileSync(filePath, 'utf-8');
+    const escaped = moduleName.replace(/\./g, '\\.');
+    const pattern = new RegExp(`^from\\s+${escaped}\\s+import\\s+(\\([^)]*\\)|[^\\n]*)`, 'gm');
+    let match;
+    while ((match = pattern.exec(content)) !== null) {
+        for (const part of match[1].replace(/#[^\n]*/g, '').replace(/[()\\]/g, '').split(',')) {
+            const name = part.trim().split(/\s+as\s+/).pop();
+            if (name) {
+                names.add(name);
+            }
+        }
+    }
+    return names;
+}
+
 /**
  * Prepend text to the beginning of a file
  * @param filePath file path
@@ -6,16 +6,19 @@ from core import (
     Session,
     Pagination,
     PaginationData,
+    Fields,
     QueryService,
     GeneralResponse,
+    entity_cache,
 )
 from core.exception import BadRequestException, PermissionDeniedException
 from .schema import User, UserCreate, UserRead, UserUpdate, UserProfile, UserClaims
 from .filter import UserFilter
-from .tool import hash_password, verify_password, update_password
+from .tool import hash_password_async, update_password
 from .dependency import GetUserInfo, get_root_info
 
 router = APIRouter(prefix=settings.user_uri, tags=["user"])
+entity_cache.enable(User, schema=UserRead)
 
 
 @router.post("/")
@@ -26,7 +29,7 @@ async def create_user(session: Session, user_in: UserCreate) -> UserRead:
         UserRead: User Information
     """
     user_data = user_in.model_dump()
-    user_data["password"] = hash_password(user_in.password)
+    user_data["password"] = await hash_password_async(user_in.password)
     user_create = UserCreate.model_validate(user_data)
     user_create.root = False
     return await QueryService[UserCreate](session, User).create(user_create)
@@ -39,7 +42,9 @@ async def get_user(session: Session, user_info: GetUserInfo) -> UserRead:
     Returns:
         UserRead: User Profile
     """
-    return await QueryService[UserRead](session, User).read(user_info.user_id)
+    return await QueryService[UserRead](session, User, schema=UserRead).read(
+        user_info.user_id
+    )
 
 
 @router.post("/update-password")
@@ -70,14 +75,20 @@ async def get_user(session: Session, user_id: UUID) -> UserRead:
 async def get_users(
     session: Session,
     page_info: Pagination,
+    fields: Fields,
     filter: UserFilter = FilterDepends(UserFilter),
 ) -> PaginationData[UserRead]:
     """List all users.
 
+    Args:
+        fields (str): Comma separated fields to return, all if empty
+
     Returns:
         PaginationData[UserRead]: User List
     """
-    return await QueryService[UserRead](session, User).list(page_info, filter)
+    return await QueryService[UserRead](
+        session, User, schema=UserRead, fields=fields
+    ).list(page_info, filter)
 
 
 @router.put("/update-profile")
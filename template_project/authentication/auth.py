@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from typing import Annotated
-from core import settings, Session, QueryService
+from core import settings, Session, GeneralResponse
 from core.exception import AuthenticationException
-from .schema import JwtToken, LoginRequest, RefreshRequest, UserRead, User
+from .schema import JwtToken, LoginRequest, RefreshRequest, User
 from .tool import create_jwt_token, verify_user, verify_token
+from .revocation import revoke_token
+from .dependency import GetUserInfo
 
 auth_router = APIRouter(prefix=settings.auth_uri, tags=["login"])
 
@@ -33,9 +35,28 @@ async def login(session: Session, login_data: LoginRequest) -> JwtToken:
 async def refresh_token(session: Session, refresh_data: RefreshRequest) -> JwtToken:
     claims = verify_token(refresh_data.refresh_token, "refresh")
 
-    service = QueryService[UserRead](session, User)
-    user = await service.get(claims.user_id)
+    user = await session.get(User, claims.user_id)
     if not user:
         raise AuthenticationException(detail="Token is incorrect.")
 
+    # Refresh tokens are single use
+    await revoke_token(session, claims)
     return create_jwt_token(user)
+
+
+@auth_router.post("/logout")
+async def logout(
+    session: Session, refresh_data: RefreshRequest, user_info: GetUserInfo
+) -> GeneralResponse:
+    """Revoke the current access token and the given refresh token.
+
+    Returns:
+        GeneralResponse: Logout Result
+    """
+    claims = verify_token(refresh_data.refresh_token, "refresh")
+    if claims.user_id != user_info.user_id:
+        raise AuthenticationException(detail="Token is incorrect.")
+
+    await revoke_token(session, user_info)
+    await revoke_token(session, claims)
+    return GeneralResponse(detail="Logout successfully.")
@@ -20,8 +20,8 @@ def get_user_info(
     try:
         user_claims = verify_token(token, "access")
         return user_claims
-    except (InvalidTokenException, TokenExpiredException) as e:
-        raise e
+    except AuthenticationException:
+        raise
     except Exception:
         raise AuthenticationException()
 
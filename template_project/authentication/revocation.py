@@ -0,0 +1,107 @@
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import select, delete
+import asyncio
+import time
+from core import settings, logger
+from core.session import async_session
+from .schema import RevokedToken, UserClaims
+
+
+class RevocationList:
+    """In-memory mirror of the revoked_token table.
+
+    The revoked jtis ({jti: exp}) are refreshed incrementally from the highest
+    row id already seen, so `is_revoked` is one dict lookup and never queries
+    the database.
+
+    Ids are assigned at insert time, so a row with a lower id can commit
+    after a higher one was read. Each refresh therefore re-reads the last
+    `token_revocation_lookback_ids` ids, and the whole table is re-read every
+    `token_revocation_reload_seconds` for anything older.
+    """
+
+    def __init__(self):
+        self._revoked: dict[str, int] = {}
+        self._last_id = 0
+        self._last_prune = time.monotonic()
+        self._last_reload = time.monotonic()
+        self._task: asyncio.Task | None = None
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def add(self, jti: str, exp: int):
+        self._revoked[jti] = exp
+
+    async def refresh(self, full: bool = False):
+        if time.monotonic() - self._last_reload >= settings.token_revocation_reload_seconds:
+            full = True
+        since = 0 if full else self._last_id - settings.token_revocation_lookback_ids
+
+        async with async_session() as session:
+            result = await session.execute(
+                select(RevokedToken)
+                .where(RevokedToken.id > since)
+                .order_by(RevokedToken.id)
+            )
+            for row in result.scalars():
+                self.add(row.jti, row.exp)
+                self._last_id = max(self._last_id, row.id)
+            if full:
+                self._last_reload = time.monotonic()
+
+            if time.monotonic() - self._last_prune >= settings.token_revocation_prune_seconds:
+                await self._prune(session)
+
+    async def _prune(self, session):
+        now = int(time.time())
+        await session.execute(delete(RevokedToken).where(RevokedToken.exp < now))
+        await session.commit()
+
+        self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp >= now}
+        self._last_prune = time.monotonic()
+
+    async def start(self):
+        try:
+            await self.refresh(full=True)
+        except Exception as e:
+            logger.error(f"Failed to load revoked tokens: {e}")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.token_revocation_refresh_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Failed to refresh revoked tokens: {e}")
+
+
+revocation_list = RevocationList()
+
+
+async def revoke_token(session, claims: UserClaims):
+    """Persist the revocation of a token and apply it to this worker at once.
+
+    Other workers pick it up on their next refresh, at most
+    `settings.token_revocation_refresh_seconds` later.
+    """
+    if not claims.jti:
+        return
+    statement = (
+        insert(RevokedToken)
+        .values(jti=claims.jti, user_id=claims.user_id, exp=claims.exp)
+        .on_conflict_do_nothing(index_elements=["jti"])
+    )
+    await session.execute(statement)
+    await session.commit()
+    revocation_list.add(claims.jti, claims.exp)
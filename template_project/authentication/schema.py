@@ -29,6 +29,15 @@ class User(UserBase, table=True):
     password: str = Field(max_length=128)
 
 
+class RevokedToken(SQLModel, table=True):
+    __tablename__ = "revoked_token"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    jti: str = Field(max_length=64, unique=True)
+    user_id: UUID = Field(index=True)
+    exp: int = Field(index=True)
+
+
 class JwtToken(BaseModel):
     access_token: str
     refresh_token: str
@@ -51,9 +60,13 @@ class RefreshRequest(BaseModel):
 
 
 class UserClaims(BaseModel):
+    # Shared between requests by the verified-token cache
+    model_config = {"frozen": True}
+
     user_id: UUID
     username: str
     root: bool = False
     exp: int
     iat: int
     type: str  # "access" or "refresh"
+    jti: Optional[str] = None
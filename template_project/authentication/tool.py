@@ -1,15 +1,32 @@
 from pwdlib import PasswordHash
 from sqlmodel import select
-from uuid import UUID
+from uuid import UUID, uuid4
 from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import hashlib
+import threading
+import time
 import jwt
-from core import settings, Session
+from core import settings, Session, entity_cache, register_collector
 from core.exception import NotFoundException, AuthenticationException
 from .schema import User, UserClaims, JwtToken
+from .revocation import revocation_list
 
 
 pwd_context = PasswordHash.recommended()
 
+# {sha256(token type + token): verified claims}, in LRU order
+_token_cache: OrderedDict[bytes, UserClaims] = OrderedDict()
+_token_cache_lock = threading.Lock()
+_token_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+# Argon2 takes tens of milliseconds of CPU, so async handlers run it on a
+# bounded executor instead of blocking the event loop
+_hash_executor: Executor | None = None
+_hash_stats = {"in_flight": 0, "count": 0, "time_total": 0.0, "time_max": 0.0}
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password + settings.app_secret)
@@ -19,6 +36,66 @@ def verify_password(password: str, hashed_password: str) -> bool:
     return pwd_context.verify(password + settings.app_secret, hashed_password)
 
 
+async def hash_password_async(password: str) -> str:
+    return await _run_in_hash_executor(hash_password, password)
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    return await _run_in_hash_executor(verify_password, password, hashed_password)
+
+
+def _get_hash_executor() -> Executor:
+    global _hash_executor
+    if _hash_executor is None:
+        if settings.password_hash_executor == "process":
+            _hash_executor = ProcessPoolExecutor(
+                max_workers=settings.password_hash_workers
+            )
+        else:
+            _hash_executor = ThreadPoolExecutor(
+                max_workers=settings.password_hash_workers,
+                thread_name_prefix="password-hash",
+            )
+    return _hash_executor
+
+
+async def _run_in_hash_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    _hash_stats["in_flight"] += 1
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_get_hash_executor(), func, *args)
+    finally:
+        elapsed = time.perf_counter() - start
+        _hash_stats["in_flight"] -= 1
+        _hash_stats["count"] += 1
+        _hash_stats["time_total"] += elapsed
+        _hash_stats["time_max"] = max(_hash_stats["time_max"], elapsed)
+
+
+def password_hash_status() -> dict:
+    """Queue depth and latency (including queue wait) of async password hashing."""
+    count = _hash_stats["count"]
+    return {
+        "workers": settings.password_hash_workers,
+        "in_flight": _hash_stats["in_flight"],
+        "queued": max(_hash_stats["in_flight"] - settings.password_hash_workers, 0),
+        "count": count,
+        "time_total": _hash_stats["time_total"],
+        "time_avg": _hash_stats["time_total"] / count if count else 0.0,
+        "time_max": _hash_stats["time_max"],
+    }
+
+
+async def shutdown_hash_executor():
+    global _hash_executor
+    if _hash_executor is not None:
+        executor, _hash_executor = _hash_executor, None
+        # Waiting for running Argon2 jobs must not block the event loop;
+        # queued ones are dropped, their requests are ending anyway
+        await asyncio.to_thread(executor.shutdown, cancel_futures=True)
+
+
 async def update_password(
     session: Session, user_id: UUID, old_password: str, new_password: str
 ):
@@ -26,10 +103,11 @@ async def update_password(
     if not item:
         raise NotFoundException()
 
-    if not verify_password(old_password, item.password):
+    if not await verify_password_async(old_password, item.password):
         raise AuthenticationException(detail="old password not correct.")
-    item.password = hash_password(new_password)
+    item.password = await hash_password_async(new_password)
     await session.commit()
+    await entity_cache.invalidate(User, [user_id])
 
 
 def create_jwt_token(user: User):
@@ -52,6 +130,7 @@ def create_token(user: User, token_type: str, expries_delta_min: int) -> str:
         "exp": expire,
         "iat": datetime.now(timezone.utc),
         "type": token_type,
+        "jti": uuid4().hex,
     }
     encoded_jwt = jwt.encode(
         to_encode, settings.app_secret, algorithm=settings.auth_algorithm
@@ -66,12 +145,51 @@ async def verify_user(username: str, password: str, session: Session) -> User |
 
     if not user:
         return None
-    if not verify_password(password, user.password):
+    if not await verify_password_async(password, user.password):
         return None
     return user
 
 
 def verify_token(token: str, token_type: str) -> UserClaims:
+    """Verify a jwt token, answering repeated tokens from the verified-token cache.
+
+    The cache is keyed by a digest of the exact token string, so a tampered
+    token never matches an entry and always goes through full verification.
+    Entries expire at the token's own `exp`.
+    """
+    key = hashlib.sha256(f"{token_type}:{token}".encode()).digest()
+    with _token_cache_lock:
+        claims = _token_cache.get(key)
+        if claims is not None:
+            if claims.exp > time.time():
+                _token_cache.move_to_end(key)
+                _token_cache_stats["hits"] += 1
+            else:
+                del _token_cache[key]
+                claims = None
+        if claims is None:
+            _token_cache_stats["misses"] += 1
+
+    if claims is None:
+        claims = _decode_token(token, token_type)
+        if settings.token_cache_size > 0:
+            with _token_cache_lock:
+                _token_cache[key] = claims
+                while len(_token_cache) > settings.token_cache_size:
+                    _token_cache.popitem(last=False)
+                    _token_cache_stats["evictions"] += 1
+
+    # Checked on every call, so a revoked token stops working even when cached
+    if claims.jti and revocation_list.is_revoked(claims.jti):
+        raise AuthenticationException(detail="token is revoked.")
+    return claims
+
+
+def token_cache_status() -> dict:
+    return {"size": len(_token_cache), **_token_cache_stats}
+
+
+def _decode_token(token: str, token_type: str) -> UserClaims:
     try:
         payload = jwt.decode(
             token, settings.app_secret, algorithms=[settings.auth_algorithm]
@@ -95,8 +213,17 @@ def verify_token(token: str, token_type: str) -> UserClaims:
             exp=payload.get("exp"),
             iat=payload.get("iat"),
             type=token_type_in_payload,
+            jti=payload.get("jti"),
         )
     except jwt.ExpiredSignatureError:
         raise AuthenticationException(detail="token is expired.")
     except jwt.PyJWTError:
         raise AuthenticationException(detail="token is invalid.")
+
+
+register_collector(
+    "password_hash", password_hash_status, counters=("count", "time_total")
+)
+register_collector(
+    "token_cache", token_cache_status, counters=("hits", "misses", "evictions")
+)
@@ -1,7 +1,5 @@
 import typer
 from core import settings
-from .migrate import migrate_database
-from .create_root_user import create_root_user
 
 command = typer.Typer(help=f"{settings.app_name} command line tool")
 
@@ -10,21 +8,115 @@ command = typer.Typer(help=f"{settings.app_name} command line tool")
 def serve(
     host: str = typer.Argument(default="127.0.0.1", help="Host address"),
     port: int = typer.Argument(default=9000, help="Port number"),
+    prod: bool = typer.Option(
+        False, "--prod", help="Multiple workers without reload, for production"
+    ),
+    workers: int = typer.Option(
+        default=None, help="Worker processes with --prod, defaults to CPU count"
+    ),
 ):
     import uvicorn
 
-    uvicorn.run("main:app", host=host, port=port, reload=True)
+    if not prod:
+        uvicorn.run("main:app", host=host, port=port, reload=True)
+        return
+
+    import os
+    from .serve import production_environment, production_options
+
+    # Workers are new processes that read their settings from the environment
+    os.environ.update(production_environment())
+    options = production_options(workers)
+    if settings.metrics_url:
+        from core.metrics import prepare_metrics_dir
+
+        print(f"Workers share metrics through: {prepare_metrics_dir()}")
+    uvicorn.run("main:app", host=host, port=port, **options)
 
 
 @command.command(help="Auto-detect all schemas and migrate database")
 def migrate(
     message: str = typer.Argument(
         default="Automatically generated.", help="Migration message"
-    )
+    ),
+    check: bool = typer.Option(
+        False, "--check", help="Only check the database is up to date, for CI"
+    ),
+):
+    from .migrate import migrate_database
+
+    if not migrate_database(message, check):
+        raise typer.Exit(code=1)
+
+
+@command.command(help="Run background tasks of the 'queue' or 'database' task backend")
+def worker(
+    workers: int = typer.Option(
+        default=None, help="Pool processes, defaults to settings or CPU count"
+    ),
 ):
-    migrate_database(message)
+    if settings.task_backend not in ("queue", "database"):
+        print(f"task_backend '{settings.task_backend}' runs tasks in the server")
+        raise typer.Exit(code=1)
+
+    import asyncio
+    from main import app  # noqa: F401, imports the task modules with the routers
+    from core.broker import run_worker
+
+    try:
+        asyncio.run(run_worker(workers))
+    except KeyboardInterrupt:
+        pass
 
 
 @command.command(help="Create root user")
 def root_user():
+    from .create_root_user import create_root_user
+
     create_root_user()
+
+
+@command.command(help="Benchmark response serialization of a list page")
+def benchmark_serialize(
+    rows: int = typer.Option(default=500, help="Rows in the page"),
+    rounds: int = typer.Option(default=200, help="Requests per response path"),
+):
+    from .benchmark import benchmark_serialization
+
+    benchmark_serialization(rows, rounds)
+
+
+@command.command(help="Benchmark response compression against the old GZip setup")
+def benchmark_compress(
+    rows: int = typer.Option(default=500, help="Rows in the JSON page"),
+    rounds: int = typer.Option(default=200, help="Requests per setup"),
+):
+    from .benchmark import benchmark_compression
+
+    benchmark_compression(rows, rounds)
+
+
+@command.command(help="Benchmark the per-request overhead of the metrics middleware")
+def benchmark_metrics(
+    rounds: int = typer.Option(default=100000, help="Requests per setup"),
+):
+    from .benchmark import benchmark_metrics
+
+    benchmark_metrics(rounds)
+
+
+@command.command(help="Write the route manifest used by workers instead of scanning")
+def routes():
+    from core.router import write_route_manifest
+
+    print(f"Route manifest written to: {write_route_manifest()}")
+
+
+@command.command(help="Write the OpenAPI document served when openapi_mode is 'file'")
+def openapi(
+    output: str = typer.Option(default=None, help="Output file, defaults to settings"),
+):
+    from main import app
+    from core.openapi import write_openapi
+
+    print(f"OpenAPI document written to: {write_openapi(app, output)}")
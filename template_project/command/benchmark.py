@@ -0,0 +1,186 @@
+from uuid import uuid4
+import time
+
+
+def _time_requests(
+    client, url: str, rounds: int, headers: dict | None = None
+) -> float:
+    client.get(url, headers=headers)  # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        client.get(url, headers=headers)
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def benchmark_serialization(rows: int, rounds: int):
+    """Compare the cost of sending one list page through each response path.
+
+    Rows are built in memory, so the numbers only cover FastAPI's response
+    handling and JSON encoding, not the database.
+    """
+    from fastapi import FastAPI
+    from fastapi.datastructures import Default
+    from fastapi.testclient import TestClient
+    from core.schema import PaginationData
+    from core.response import FastJSONResponse, trusted_response
+    from authentication.schema import User, UserRead
+
+    users = [
+        User(
+            id=uuid4(),
+            username=f"user{index}",
+            email=f"user{index}@example.com",
+            name=f"User {index}",
+            password="x" * 60,
+        )
+        for index in range(rows)
+    ]
+
+    def page() -> PaginationData:
+        return PaginationData(
+            detail=users,
+            total_count=rows,
+            total_page=1,
+            page_index=1,
+            page_size=rows,
+            page_count=rows,
+        )
+
+    app = FastAPI()
+
+    @app.get("/default")
+    async def default() -> PaginationData[UserRead]:
+        return page()
+
+    @app.get("/fast-default", response_class=Default(FastJSONResponse))
+    async def fast_default() -> PaginationData[UserRead]:
+        return page()
+
+    @app.get("/trusted")
+    async def trusted() -> PaginationData[UserRead]:
+        return trusted_response(page(), UserRead)
+
+    paths = {
+        "default": "/default",
+        "fast-default": "/fast-default",
+        "trusted": "/trusted",
+    }
+    with TestClient(app) as client:
+        bodies = {name: client.get(url).json() for name, url in paths.items()}
+        if any(body != bodies["default"] for body in bodies.values()):
+            raise RuntimeError("Response paths returned different bodies")
+
+        print(f"{rows} rows, {rounds} rounds, ms per request:")
+        baseline = None
+        for name, url in paths.items():
+            elapsed = _time_requests(client, url, rounds)
+            baseline = baseline or elapsed
+            print(f"  {name:<12} {elapsed:8.3f}  x{baseline / elapsed:.2f}")
+
+
+def benchmark_compression(rows: int, rounds: int):
+    """Compare the previous GZip setup with the negotiated compression middleware.
+
+    The body is a JSON list page; numbers cover compression inside a full
+    in-process request.
+    """
+    from fastapi import FastAPI, Response
+    from fastapi.middleware.gzip import GZipMiddleware
+    from fastapi.testclient import TestClient
+    from pydantic_core import to_json
+    from core.compression import CompressionMiddleware, available_encodings
+    from core.settings import settings
+
+    body = to_json(
+        {
+            "detail": [
+                {
+                    "id": str(uuid4()),
+                    "username": f"user{index}",
+                    "email": f"user{index}@example.com",
+                    "name": f"User {index}",
+                    "root": False,
+                }
+                for index in range(rows)
+            ]
+        }
+    )
+
+    def make_app(middleware, **options) -> FastAPI:
+        app = FastAPI()
+
+        @app.get("/")
+        async def page():
+            return Response(body, media_type="application/json")
+
+        app.add_middleware(middleware, **options)
+        return app
+
+    levels = {
+        "zstd": settings.compression_zstd_level,
+        "br": settings.compression_brotli_level,
+        "gzip": settings.compression_gzip_level,
+    }
+    cases = [("gzip-9 (previous)", make_app(GZipMiddleware, compresslevel=9), "gzip")]
+    for encoding in available_encodings(settings.compression_encodings):
+        app = make_app(CompressionMiddleware, encodings=[encoding], levels=levels)
+        cases.append((f"{encoding}-{levels[encoding]}", app, encoding))
+
+    print(f"{len(body)} byte body, {rounds} rounds:")
+    print(f"  {'setup':<18} {'ms/req':>8} {'req/s':>8} {'bytes':>8} {'ratio':>6}")
+    for name, app, encoding in cases:
+        with TestClient(app) as client:
+            headers = {"Accept-Encoding": encoding}
+            size = int(client.get("/", headers=headers).headers["content-length"])
+            elapsed = _time_requests(client, "/", rounds, headers)
+        print(
+            f"  {name:<18} {elapsed:8.3f} {1000 / elapsed:8.0f} "
+            f"{size:8} {len(body) / size:6.2f}"
+        )
+
+
+def benchmark_metrics(rounds: int):
+    """Time the metrics middleware around a minimal ASGI app.
+
+    The app and transport are in-process stubs, so the difference between
+    the two runs is the per-request cost of the middleware itself.
+    """
+    import asyncio
+    from core.metrics import MetricsMiddleware
+
+    class Route:
+        path_format = "/items/{item_id}"
+
+    async def app(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        pass
+
+    async def run(handler) -> float:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            scope = {"type": "http", "method": "GET", "path": "/items/1"}
+            await handler(scope, receive, send)
+        return (time.perf_counter() - start) / rounds * 1_000_000
+
+    async def main():
+        cases = {
+            "bare app": app,
+            "metrics": MetricsMiddleware(app),
+            "metrics + timing": MetricsMiddleware(app, server_timing=True),
+        }
+        await run(app)  # warm up
+        baseline = None
+        print(f"{rounds} requests, us per request:")
+        for name, handler in cases.items():
+            elapsed = await run(handler)
+            baseline = baseline if baseline is not None else elapsed
+            print(f"  {name:<18} {elapsed:7.2f}  +{elapsed - baseline:.2f}")
+
+    asyncio.run(main())
@@ -1,21 +1,31 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import os
-import sys
 import ast
-import subprocess
+import hashlib
+import importlib
+import json
+import time
 
 from core.settings import settings
 
+# Parse results per file, reused while the file is unchanged
+CACHE_FILE = ".schema_cache.json"
+CACHE_VERSION = 1
+# Below this many changed files a process pool costs more than it saves
+PARALLEL_MINIMUM_FILES = 16
 
-def find_schemas(file_path: Path) -> list:
-    with open(file_path, "r", encoding="utf-8") as f:
-        source = f.read()
 
-    tree = ast.parse(source)
+def parse_schema_file(source: bytes) -> dict:
+    """Collect class definitions and imported names of one python file.
 
-    # First pass: collect all classes and their base class info
-    class_bases = {}  # {class_name: [base_class_names]}
-    class_has_table = {}  # {class_name: has_table_true}
+    Returns:
+        dict: {"classes": {name: {"bases": [...], "table": bool}},
+            "imports": {local name: [module, name, level]}}
+    """
+    tree = ast.parse(source)
+    classes = {}
+    imports = {}
 
     for node in ast.walk(tree):
         if isinstance(node, ast.ClassDef):
@@ -26,85 +36,237 @@ def find_schemas(file_path: Path) -> list:
                     bases.append(base.id)
                 elif isinstance(base, ast.Attribute):
                     bases.append(base.attr)
-            class_bases[node.name] = bases
 
             # Check if table=True is present
-            has_table = False
-            for keyword in node.keywords:
-                if keyword.arg == "table":
-                    if (
-                        isinstance(keyword.value, ast.Constant)
-                        and keyword.value.value is True
-                    ):
-                        has_table = True
-                        break
-            class_has_table[node.name] = has_table
-
-    # Recursively check if a class inherits from SQLModel
-    def inherits_sqlmodel(class_name: str, visited: set = None) -> bool:
-        if visited is None:
-            visited = set()
-        if class_name in visited:
-            return False
-        visited.add(class_name)
-
-        if class_name == "SQLModel":
-            return True
-
-        if class_name not in class_bases:
-            return False
-
-        for base in class_bases[class_name]:
-            if base == "SQLModel" or inherits_sqlmodel(base, visited):
-                return True
-        return False
+            has_table = any(
+                keyword.arg == "table"
+                and isinstance(keyword.value, ast.Constant)
+                and keyword.value.value is True
+                for keyword in node.keywords
+            )
+            classes[node.name] = {"bases": bases, "table": has_table}
+        elif isinstance(node, ast.ImportFrom):
+            for alias in node.names:
+                imports[alias.asname or alias.name] = [
+                    node.module or "",
+                    alias.name,
+                    node.level,
+                ]
 
-    # Find all classes that meet the criteria
-    result = []
-    for class_name, has_table in class_has_table.items():
-        if has_table and inherits_sqlmodel(class_name):
-            result.append(class_name)
+    return {"classes": classes, "imports": imports}
 
-    return result
 
+def _parse_file(path: str) -> tuple[str, str, dict | None]:
+    source = Path(path).read_bytes()
+    digest = hashlib.blake2b(source, digest_size=16).hexdigest()
+    try:
+        return path, digest, parse_schema_file(source)
+    except SyntaxError:
+        # Cached as None, reported by discover_tables
+        return path, digest, None
+
+
+class SchemaCache:
+    """Parse results keyed by file path, validated by mtime/size and content hash."""
+
+    def __init__(self, cache_path: Path):
+        self._path = cache_path
+        self._entries: dict[str, dict] = {}
+        try:
+            data = json.loads(cache_path.read_text(encoding="utf-8"))
+            if data.get("version") == CACHE_VERSION:
+                self._entries = data["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def lookup(self, path: str, stat: os.stat_result) -> tuple[dict | None, bool]:
+        """Return (info, hit). Files whose mtime changed are re-hashed, and
+        only parsed again if the content changed too."""
+        entry = self._entries.get(path)
+        if entry is None:
+            return None, False
+        if entry["mtime"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return entry["info"], True
+        digest = hashlib.blake2b(Path(path).read_bytes(), digest_size=16).hexdigest()
+        if digest != entry["hash"]:
+            return None, False
+        entry["mtime"], entry["size"] = stat.st_mtime_ns, stat.st_size
+        return entry["info"], True
+
+    def store(self, path: str, stat: os.stat_result, digest: str, info: dict | None):
+        self._entries[path] = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": digest,
+            "info": info,
+        }
+
+    def save(self, paths: set[str]):
+        # Forget deleted files
+        files = {path: entry for path, entry in self._entries.items() if path in paths}
+        try:
+            self._path.write_text(
+                json.dumps({"version": CACHE_VERSION, "files": files}), encoding="utf-8"
+            )
+        except OSError as e:
+            print(f"Failed to write schema cache {self._path}: {e}")
 
-def generate_imports(search_base: Path) -> list[str]:
-    result = []
 
-    for item in search_base.iterdir():
+def collect_schema_files(search_base: Path) -> list[tuple[Path, str]]:
+    """Module `schema.py` files and every python file under external_schema_path,
+    with their import module names."""
+    files = []
+    for item in sorted(search_base.iterdir()):
         if item.is_dir() and item.name != "core" and item.name != "__pycache__":
             schema_file = item.joinpath("schema.py")
-            if not schema_file.exists():
-                continue
-            classes = find_schemas(schema_file)
-            for clz in classes:
-                result.append(f"from {item.name}.schema import {clz}")
-
-    return result
-
-
-def generate_imports_from_external_path(external_path: Path) -> list[str]:
-    result = []
-
-    # 遍历目录及子目录中所有py文件
-    for py_file in external_path.rglob("*.py"):
-        # 跳过 __pycache__ 目录
-        if "__pycache__" in py_file.parts:
-            continue
-
-        print(f"find: {py_file}")
-        classes = find_schemas(py_file)
-        if not classes:
-            continue
-
-        # 包含external_path目录名作为模块前缀
-        relative_path = py_file.relative_to(external_path.parent)
-        module_path = str(relative_path.with_suffix("")).replace(os.sep, ".")
-
-        for clz in classes:
-            result.append(f"from {module_path} import {clz}")
+            if schema_file.exists():
+                files.append((schema_file, f"{item.name}.schema"))
 
-    return result
+    if settings.external_schema_path != "":
+        external_path = Path(settings.external_schema_path).resolve()
+        # 遍历目录及子目录中所有py文件
+        for py_file in sorted(external_path.rglob("*.py")):
+            # 跳过 __pycache__ 目录
+            if "__pycache__" in py_file.parts:
+                continue
+            # 包含external_path目录名作为模块前缀
+            relative_path = py_file.relative_to(external_path.parent)
+            module_path = str(relative_path.with_suffix("")).replace(os.sep, ".")
+            files.append((py_file, module_path))
+
+    return files
+
+
+def parse_schema_files(
+    files: list[tuple[Path, str]], cache: SchemaCache
+) -> tuple[dict, int, list[str]]:
+    """Parse changed files, on a process pool when there are many.
+
+    Returns:
+        tuple[dict, int, list[str]]: {module: info} of all files, number of
+            files parsed, paths of files skipped for syntax errors
+    """
+    infos = {}
+    paths = {}  # {module: path}
+    pending = {}  # {path: (module, stat)}
+    for path, module in files:
+        stat = path.stat()
+        paths[module] = str(path)
+        info, hit = cache.lookup(str(path), stat)
+        if hit:
+            infos[module] = info
+        else:
+            pending[str(path)] = (module, stat)
+
+    if len(pending) >= PARALLEL_MINIMUM_FILES and (os.cpu_count() or 1) > 1:
+        with ProcessPoolExecutor() as executor:
+            chunksize = max(1, len(pending) // (4 * (os.cpu_count() or 1)))
+            results = list(executor.map(_parse_file, pending, chunksize=chunksize))
+    else:
+        results = [_parse_file(path) for path in pending]
+
+    for path, digest, info in results:
+        module, stat = pending[path]
+        cache.store(path, stat, digest, info)
+        infos[module] = info
+
+    # Files with syntax errors are cached as None
+    skipped = [paths[module] for module, info in infos.items() if info is None]
+    infos = {module: info for module, info in infos.items() if info is not None}
+    return infos, len(pending), skipped
+
+
+def _resolve_module(module: str, imported: str, level: int) -> str:
+    if level == 0:
+        return imported
+    package = module.rsplit(".", level)[0] if module.count(".") >= level else ""
+    return f"{package}.{imported}".strip(".") if imported else package
+
+
+SQLMODEL = ("sqlmodel", "SQLModel")
+
+
+def find_tables(infos: dict) -> list[tuple[str, str]]:
+    """Classes declared with table=True that inherit from SQLModel, following
+    base classes within a file and across files through their imports."""
+    by_name: dict[str, list[str]] = {}  # {class name: [modules defining it]}
+    for module, info in infos.items():
+        for class_name in info["classes"]:
+            by_name.setdefault(class_name, []).append(module)
+
+    resolved: dict[tuple[str, str], bool] = {}
+
+    def locate(module: str, name: str, seen: set) -> tuple[str, str] | None:
+        if (module, name) in seen:
+            return None
+        seen.add((module, name))
+
+        info = infos[module]
+        if name in info["classes"]:
+            return module, name
+        if name in info["imports"]:
+            imported, original, level = info["imports"][name]
+            target = _resolve_module(module, imported, level)
+            if imported == "sqlmodel" and original == "SQLModel":
+                return SQLMODEL
+            # An explicit import names the module, a class of the same name
+            # elsewhere must not be picked instead; outside the scan: unknown
+            if target in infos:
+                # Defined in, or re-exported by, another scanned module
+                return locate(target, original, seen)
+            return None
+        # Only attribute bases (models.Base) and star imports are left to a
+        # unique name match across the project
+        candidates = by_name.get(name, [])
+        if len(candidates) == 1:
+            return candidates[0], name
+        return None
+
+    def inherits_sqlmodel(module: str, class_name: str, visited: set) -> bool:
+        key = (module, class_name)
+        if key in resolved:
+            return resolved[key]
+        if key in visited:
+            return False
+        visited.add(key)
+
+        result = False
+        for base in infos[module]["classes"][class_name]["bases"]:
+            target = locate(module, base, set())
+            if base == "SQLModel" or target == SQLMODEL:
+                result = True
+                break
+            if target is not None and inherits_sqlmodel(*target, visited):
+                result = True
+                break
+        resolved[key] = result
+        return result
+
+    tables = []
+    for module, info in infos.items():
+        for class_name, class_info in info["classes"].items():
+            if class_info["table"] and inherits_sqlmodel(module, class_name, set()):
+                tables.append((module, class_name))
+    return tables
+
+
+def discover_tables(search_base: Path) -> list[tuple[str, str]]:
+    """(module, class) of every SQLModel table class in the project."""
+    start = time.perf_counter()
+    files = collect_schema_files(search_base)
+    cache = SchemaCache(search_base / CACHE_FILE)
+    infos, parsed, skipped = parse_schema_files(files, cache)
+    cache.save({str(path) for path, _ in files})
+    tables = find_tables(infos)
+
+    elapsed = (time.perf_counter() - start) * 1000
+    print(
+        f"Scanned {len(files)} files ({parsed} parsed, {len(files) - parsed} cached) "
+        f"in {elapsed:.0f}ms, found {len(tables)} tables"
+    )
+    if skipped:
+        print(f"Skipped {len(skipped)} files with syntax errors: {', '.join(skipped)}")
+    return tables
 
 
 def update_alembic_env(import_statements: list[str]) -> bool:
@@ -154,45 +316,79 @@ def update_alembic_env(import_statements: list[str]) -> bool:
         return False
 
 
-def execute_alembic_commands(message: str) -> bool:
-    """Execute alembic commands."""
-    try:
-        env = os.environ.copy()
-
-        if settings.external_schema_path:
-            external_parent = str(Path(settings.external_schema_path).resolve().parent)
-            python_path = env.get("PYTHONPATH", "")
-            env["PYTHONPATH"] = (
-                f"{external_parent}{os.pathsep}{python_path}"
-                if python_path
-                else external_parent
-            )
+def _alembic_config():
+    from alembic.config import Config
 
-        # Execute alembic revision command
-        revision_cmd = f'alembic revision --autogenerate -m "{message}"'
-        print(f"Executing: {revision_cmd}")
+    project_dir = Path(__file__).parent.parent
+    return Config(str(project_dir / "alembic.ini"))
 
-        result = subprocess.run(
-            revision_cmd, shell=True, capture_output=True, text=True, env=env
-        )
-        if result.returncode != 0:
-            print(f"Error in revision: {result.stderr}")
-            return False
 
-        print(result.stdout)
+def execute_alembic_commands(
+    tables: list[tuple[str, str]], message: str, check: bool = False
+) -> bool:
+    """Run Alembic in this process on a single connection.
 
-        # Execute alembic upgrade command
-        upgrade_cmd = "alembic upgrade head"
-        print(f"Executing: {upgrade_cmd}")
+    Pending revisions are applied first, then the models are compared with the
+    database; a revision is only written (and applied) when there is a diff.
+    With `check`, nothing is written and False is returned if the database is
+    behind the revisions or the models.
 
-        result = subprocess.run(
-            upgrade_cmd, shell=True, capture_output=True, text=True, env=env
-        )
-        if result.returncode != 0:
-            print(f"Error in upgrade: {result.stderr}")
-            return False
+    Revisions are written and applied with alembic's own commands, so the
+    project's alembic/env.py runs as usual. The connection is passed in
+    `config.attributes["connection"]` for env.py to reuse; an env.py that
+    ignores it opens its own.
+    """
+    from alembic import command
+    from alembic.autogenerate import compare_metadata
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    from sqlmodel import SQLModel
+    from core.session import get_sync_engine
 
-        print(result.stdout)
+    try:
+        # Register every table on SQLModel.metadata, like alembic/env.py does
+        for module in dict.fromkeys(module for module, _ in tables):
+            importlib.import_module(module)
+
+        config = _alembic_config()
+        script = ScriptDirectory.from_config(config)
+
+        with get_sync_engine().connect() as connection:
+            config.attributes["connection"] = connection
+
+            current = set(MigrationContext.configure(connection).get_current_heads())
+            heads = set(script.get_heads())
+            # Do not hold the read transaction while env.py migrates
+            connection.commit()
+            if current != heads:
+                if check:
+                    print(f"Database is at {current or 'base'}, revisions at {heads}")
+                    return False
+                print("Applying pending revisions...")
+                command.upgrade(config, "head")
+                connection.commit()
+
+            migration_context = MigrationContext.configure(
+                connection, opts={"compare_type": True}
+            )
+            diffs = compare_metadata(migration_context, SQLModel.metadata)
+            connection.commit()
+            if not diffs:
+                print("No schema changes detected, no revision written")
+                return True
+
+            print(f"Detect {len(diffs)} schema changes:")
+            for diff in diffs:
+                print(f"  {diff}")
+            if check:
+                return False
+
+            revisions = command.revision(config, message=message, autogenerate=True)
+            for revision in revisions if isinstance(revisions, list) else [revisions]:
+                if revision is not None:
+                    print(f"Generated revision: {revision.path}")
+            command.upgrade(config, "head")
+            connection.commit()
         return True
 
     except Exception as e:
@@ -200,15 +396,14 @@ def execute_alembic_commands(message: str) -> bool:
         return False
 
 
-def migrate_database(message: str):
+def migrate_database(message: str, check: bool = False) -> bool:
     # Get all SQLModel(table=True) classes and generate import statements
     search_base = Path(__file__).parent.parent
-    imports = generate_imports(search_base)
-
-    if settings.external_schema_path != "":
-        external_base = Path(settings.external_schema_path).resolve()
-        external_imports = generate_imports_from_external_path(external_base)
-        imports.extend(external_imports)
+    tables = discover_tables(search_base)
+    if settings.task_backend == "database":
+        # core is not scanned, its task queue table is only needed by this backend
+        tables.append(("core.broker", "TaskRecord"))
+    imports = [f"from {module} import {class_name}" for module, class_name in tables]
 
     if len(imports):
         print(f"Detect {len(imports)} schemas:")
@@ -216,16 +411,18 @@ def migrate_database(message: str):
             print(f"  {item}")
     else:
         print("No SQLModel table classes found")
-        return
+        return True
 
-    print("Updating alembic/env.py...")
-    if not update_alembic_env(imports):
-        print("Failed to update alembic/env.py")
-        return
+    if not check:
+        print("Updating alembic/env.py...")
+        if not update_alembic_env(imports):
+            print("Failed to update alembic/env.py")
+            return False
 
     print("Executing alembic commands...")
-    if not execute_alembic_commands(message):
-        print("Failed to execute alembic commands")
-        return
+    if not execute_alembic_commands(tables, message, check):
+        print("Schema check failed" if check else "Failed to execute alembic commands")
+        return False
 
     print("Done!")
+    return True
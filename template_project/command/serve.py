@@ -0,0 +1,53 @@
+import importlib.util
+import os
+
+from core.settings import settings
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def production_environment() -> dict[str, str]:
+    """Settings overrides for the `serve --prod` workers, as environment variables."""
+    from core.router import discover_routers, read_route_manifest
+
+    environment = {}
+    if settings.debug_mode:
+        print("debug_mode is on in settings, --prod turns it off")
+        environment["DEBUG_MODE"] = "false"
+
+    routers = read_route_manifest()
+    if routers is None:
+        print("No route manifest, workers scan for routers (`python main.py routes`)")
+    elif routers != discover_routers():
+        # A stale manifest would leave new modules unrouted
+        print("Route manifest is out of date, workers scan for routers instead")
+        environment["ROUTE_MANIFEST"] = ""
+    return environment
+
+
+def production_options(workers: int | None = None) -> dict:
+    """Uvicorn options for `serve --prod`."""
+    workers = workers or settings.serve_workers or os.cpu_count() or 1
+    # uvloop is not available on Windows
+    loop = "uvloop" if _installed("uvloop") else "asyncio"
+    http = "httptools" if _installed("httptools") else "h11"
+
+    connections = workers * (settings.db_pool_size + settings.db_max_overflow)
+    print(
+        f"Starting {workers} workers ({loop}, {http}), each with its own database "
+        f"pool, up to {connections} connections"
+    )
+    return {
+        "workers": workers,
+        "loop": loop,
+        "http": http,
+        "reload": False,
+        "backlog": settings.serve_backlog,
+        "timeout_keep_alive": settings.serve_keep_alive,
+        "timeout_graceful_shutdown": settings.serve_graceful_timeout,
+        "limit_max_requests": settings.serve_max_requests or None,
+        "limit_max_requests_jitter": settings.serve_max_requests_jitter,
+        "access_log": settings.serve_access_log,
+    }
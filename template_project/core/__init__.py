@@ -2,7 +2,19 @@ from .settings import settings
 from .logger import logger, setup_logger
 from .middleware import setup_middleware
 from .router import setup_router
-from .dependency import Session, Pagination
-from .schema import PaginationData, GeneralResponse, make_partial_model
+from .metrics import setup_metrics, register_collector
+from .dependency import Session, Pagination, CursorPagination, ETag, Fields
+from .schema import (
+    PaginationData,
+    CursorPaginationData,
+    CountStrategy,
+    BulkResult,
+    BulkUpdateItem,
+    ExportFormat,
+    GeneralResponse,
+    make_partial_model,
+)
+from .cache import entity_cache
 from .query import QueryService
-from .task import task_broker
+from .response import FastJSONResponse, export_response, trusted_response
+from .task import task_broker, task_coalescer
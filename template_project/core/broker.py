@@ -0,0 +1,656 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Optional
+import asyncio
+import importlib
+import inspect
+import os
+import signal
+import time
+
+from sqlalchemy import DateTime, Index, Interval, case, func, literal, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import SQLModel, Field, select, update, delete
+from taskiq import AsyncBroker, AsyncResultBackend, InMemoryBroker, TaskiqResult
+from taskiq.brokers.inmemory_broker import InmemoryResultBackend
+from taskiq.exceptions import ResultGetError, UnknownTaskError
+
+from .settings import settings
+from .logger import logger
+from .exception import ServiceUnavailableException
+from .session import engine
+from .task import task_broker, task_coalescer, task_stats
+
+_ACCEPTED = b"\x01"
+_REJECTED = b"\x00"
+_CHANNEL = "task_queue"
+
+
+_worker_loop: asyncio.AbstractEventLoop | None = None
+
+
+def _init_worker():
+    """Pool process initializer, one event loop for every async task it runs.
+
+    Pooled async connections belong to the loop that opened them, so a new
+    loop per task would break the next task that uses the database.
+    """
+    global _worker_loop
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+
+
+def _run_task(module: str, name: str, args: list, kwargs: dict):
+    """Runs in a pool process, the task is looked up again by its module path."""
+    target = getattr(importlib.import_module(module), name)
+    result = getattr(target, "original_func", target)(*args, **kwargs)
+    if inspect.isawaitable(result):
+        result = _worker_loop.run_until_complete(result)
+    return result
+
+
+class TaskRunner:
+    """Bounded queue of task messages, executed on a process pool.
+
+    At most `workers` tasks run at once. When the queue is full, `put` waits
+    up to `settings.task_queue_timeout` for room and then gives up, so a
+    burst slows producers down instead of growing memory without limit.
+    A task whose `dedup_key` label matches one still queued is dropped.
+    `on_done` is called with the task id once its result is stored.
+    """
+
+    def __init__(self, broker: AsyncBroker, workers: int | None = None):
+        self._broker = broker
+        self.workers = workers or settings.task_workers or os.cpu_count() or 1
+        self.on_done = None
+        self._pending = 0
+        self._queued_keys: set[str] = set()
+        self._queue: asyncio.Queue | None = None
+        self._executor: ProcessPoolExecutor | None = None
+        self._dispatchers: list[asyncio.Task] = []
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=settings.task_queue_size)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker
+        )
+        self._dispatchers = [
+            asyncio.create_task(self._dispatch()) for _ in range(self.workers)
+        ]
+
+    async def stop(self):
+        if self._executor is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), settings.task_shutdown_timeout)
+        except TimeoutError:
+            logger.warning(f"Dropped {self._queue.qsize()} queued tasks on shutdown")
+        for dispatcher in self._dispatchers:
+            dispatcher.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._executor.shutdown(cancel_futures=True)
+        self._executor = None
+
+    @property
+    def idle(self) -> int:
+        """Tasks that could start right now, queued ones included."""
+        return max(self.workers - self._pending, 0)
+
+    async def put(self, data: bytes, deduplicate: bool = True) -> bool:
+        if self._queue is None:
+            raise RuntimeError("Task broker is not started")
+        message = self._broker.formatter.loads(data)
+        key = message.labels.get("dedup_key") if deduplicate else None
+        if key is not None:
+            if key in self._queued_keys:
+                task_coalescer.record("deduplicated")
+                return True
+            self._queued_keys.add(key)
+        item = (message, key, time.perf_counter())
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(
+                    self._queue.put(item), settings.task_queue_timeout
+                )
+            except TimeoutError:
+                self._queued_keys.discard(key)
+                task_stats.reject()
+                return False
+        task_stats.queued += 1
+        self._pending += 1
+        return True
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message, key, queued_at = await self._queue.get()
+            # Running already, a new duplicate may see newer data
+            self._queued_keys.discard(key)
+            task_stats.queued -= 1
+            task_stats.running += 1
+            try:
+                await self._execute(loop, message, queued_at)
+            except Exception as e:
+                logger.error(f"Failed to run task: {e!r}")
+            finally:
+                task_stats.running -= 1
+                self._pending -= 1
+                self._queue.task_done()
+
+    async def _execute(self, loop, message, queued_at: float):
+        value, error = None, None
+        start = time.perf_counter()
+        try:
+            task = self._broker.find_task(message.task_name)
+            if task is None:
+                raise UnknownTaskError(task_name=message.task_name)
+            func = task.original_func
+            value = await loop.run_in_executor(
+                self._executor,
+                _run_task,
+                func.__module__,
+                func.__name__,
+                message.args,
+                message.kwargs,
+            )
+        except Exception as e:
+            error = e
+            logger.error(f"Task {message.task_name} failed: {e!r}")
+        elapsed = time.perf_counter() - start
+        task_stats.record(start - queued_at, elapsed, failed=error is not None)
+
+        await self._broker.result_backend.set_result(
+            message.task_id,
+            TaskiqResult(
+                is_err=error is not None,
+                return_value=value,
+                execution_time=elapsed,
+                labels=message.labels,
+                error=error,
+            ),
+        )
+        if self.on_done is not None:
+            self.on_done(message.task_id)
+
+
+class MemoryBroker(InMemoryBroker):
+    """InMemoryBroker that honours `dedup_key` labels.
+
+    Tasks start as soon as they are sent, so there is no queue to find a
+    duplicate in: a task whose key matches one still running is dropped.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._running_keys: set[str] = set()
+
+    async def kick(self, message):
+        key = message.labels.get("dedup_key")
+        if key is None:
+            await super().kick(message)
+            return
+        if key in self._running_keys:
+            task_coalescer.record("deduplicated")
+            return
+        if self.find_task(message.task_name) is None:
+            raise UnknownTaskError(task_name=message.task_name)
+
+        self._running_keys.add(key)
+        task = asyncio.create_task(self.receiver.callback(message=message.message))
+        self._running_tasks.add(task)
+        task.add_done_callback(self._running_tasks.discard)
+        task.add_done_callback(lambda _: self._running_keys.discard(key))
+
+
+class ProcessPoolBroker(AsyncBroker):
+    """Runs tasks on a process pool owned by this server worker.
+
+    CPU-heavy tasks no longer share the event loop with requests. Task
+    functions must be defined at module level and take picklable arguments,
+    taskiq dependencies are not resolved. Each server worker starts its own
+    pool; with `serve --prod` the "queue" backend keeps one pool per host.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.result_backend = InmemoryResultBackend()
+        self._runner = TaskRunner(self)
+
+    async def startup(self):
+        await super().startup()
+        await self._runner.start()
+
+    async def shutdown(self):
+        await self._runner.stop()
+        await super().shutdown()
+
+    async def kick(self, message):
+        if not await self._runner.put(message.message):
+            raise ServiceUnavailableException("Task queue is full")
+
+    def listen(self):
+        raise RuntimeError("Process pool broker cannot listen.")
+
+
+class LocalQueueBroker(AsyncBroker):
+    """Sends tasks to `python main.py worker` over local sockets.
+
+    The worker answers each message once it is queued, so a full worker
+    queue blocks `kiq()` up to `settings.task_queue_timeout` before failing.
+    Up to `settings.task_queue_connections` messages are sent at once, each
+    on its own pooled connection. When the worker does not answer in time
+    the task may still have been queued; the 503 names its task id.
+    Results stay in the worker, `wait_result()` is not available.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(settings.task_queue_connections)
+
+    async def shutdown(self):
+        while self._idle:
+            self._close(self._idle.pop())
+        await super().shutdown()
+
+    async def kick(self, message):
+        async with self._slots:
+            for attempt in range(2):
+                # Idle connections may be stale after a worker restart, the
+                # retry always connects again
+                connection = self._idle.pop() if self._idle and not attempt else None
+                try:
+                    if connection is None:
+                        connection = await asyncio.open_connection(
+                            settings.task_queue_host, settings.task_queue_port
+                        )
+                    accepted = await self._send(connection, message.message)
+                except TimeoutError:
+                    # Not retried, the worker may have queued it after all
+                    self._close(connection)
+                    raise ServiceUnavailableException(
+                        f"Task worker is not responding, task {message.task_id} "
+                        "may still run"
+                    )
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    self._close(connection)
+                    if attempt:
+                        logger.error(f"Task worker unreachable: {e!r}")
+                        raise ServiceUnavailableException("Task worker unreachable")
+                    continue
+                except BaseException:
+                    # Cancelled mid-message, the connection is out of step
+                    self._close(connection)
+                    raise
+                self._idle.append(connection)
+                break
+        if not accepted:
+            raise ServiceUnavailableException("Task queue is full")
+
+    def listen(self):
+        raise RuntimeError("Local queue broker cannot listen, run the worker.")
+
+    async def consume(self, runner: TaskRunner):
+        """Worker side: accept tasks on the local socket until cancelled."""
+        connections = set()
+        server = await asyncio.start_server(
+            partial(_serve_connection, runner, connections),
+            settings.task_queue_host,
+            settings.task_queue_port,
+        )
+        logger.info(
+            f"Task worker listening on {settings.task_queue_host}:"
+            f"{settings.task_queue_port} with {runner.workers} processes"
+        )
+        try:
+            await asyncio.Future()
+        finally:
+            # Server workers keep their connections open, close them instead
+            # of waiting
+            server.close()
+            for writer in list(connections):
+                writer.close()
+
+    @staticmethod
+    async def _send(connection, data: bytes) -> bool:
+        reader, writer = connection
+        writer.write(len(data).to_bytes(4, "big") + data)
+        await writer.drain()
+        reply = await asyncio.wait_for(
+            reader.readexactly(1), settings.task_queue_timeout + 5
+        )
+        return reply == _ACCEPTED
+
+    @staticmethod
+    def _close(connection):
+        if connection is not None:
+            connection[1].close()
+
+
+async def _serve_connection(
+    runner: TaskRunner,
+    connections: set,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+):
+    connections.add(writer)
+    try:
+        while True:
+            size = int.from_bytes(await reader.readexactly(4), "big")
+            data = await reader.readexactly(size)
+            writer.write(_ACCEPTED if await runner.put(data) else _REJECTED)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        connections.discard(writer)
+        writer.close()
+
+
+class TaskRecord(SQLModel, table=True):
+    """A task of the "database" backend, from kiq() until its result expires."""
+
+    __tablename__ = "task_queue"
+    __table_args__ = (
+        Index("ix_task_queue_status_run_at", "status", "run_at"),
+        # At most one queued task per dedup key, claimed ones free the key
+        Index(
+            "ix_task_queue_dedup_key",
+            "dedup_key",
+            unique=True,
+            postgresql_where=text("status = 'queued'"),
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    task_id: str = Field(max_length=64, unique=True)
+    task_name: str = Field(max_length=255)
+    message: bytes
+    dedup_key: Optional[str] = Field(default=None, max_length=255)
+    # queued, running, done or failed
+    status: str = Field(default="queued", max_length=16)
+    attempts: int = Field(default=0)
+    # When a queued task may run, or when a running task's claim expires
+    run_at: datetime = Field(sa_type=DateTime(timezone=True))
+    finished_at: Optional[datetime] = Field(
+        default=None, sa_type=DateTime(timezone=True), index=True
+    )
+    result: Optional[bytes] = None
+
+
+def _seconds(value: float):
+    return literal(timedelta(seconds=value), Interval)
+
+
+class DatabaseResultBackend(AsyncResultBackend):
+    """Results stored on the task's row, looked up by its unique task id.
+
+    A failed task is put back in the queue instead, with exponential backoff,
+    until it ran `settings.task_max_attempts` times.
+    """
+
+    async def set_result(self, task_id: str, result: TaskiqResult):
+        data = result.model_dump_json().encode()
+        if result.is_err:
+            retry = TaskRecord.attempts < settings.task_max_attempts
+            backoff = _seconds(settings.task_retry_delay) * func.power(
+                2, TaskRecord.attempts - 1
+            )
+            values = {
+                "status": case((retry, "queued"), else_="failed"),
+                "run_at": case((retry, func.now() + backoff), else_=TaskRecord.run_at),
+                "finished_at": case((retry, None), else_=func.now()),
+                # A retry must not collide with a newer queued duplicate
+                "dedup_key": case((retry, None), else_=TaskRecord.dedup_key),
+                "result": data,
+            }
+        else:
+            values = {"status": "done", "finished_at": func.now(), "result": data}
+
+        async with engine.begin() as connection:
+            await connection.execute(
+                update(TaskRecord).where(TaskRecord.task_id == task_id).values(values)
+            )
+
+    async def is_result_ready(self, task_id: str) -> bool:
+        status = await self.get_status(task_id)
+        return status is not None and status["status"] in ("done", "failed")
+
+    async def get_result(self, task_id: str, with_logs: bool = False) -> TaskiqResult:
+        async with engine.connect() as connection:
+            data = await connection.scalar(
+                select(TaskRecord.result).where(TaskRecord.task_id == task_id)
+            )
+        if data is None:
+            raise ResultGetError()
+        return TaskiqResult.model_validate_json(data)
+
+    async def get_status(self, task_id: str) -> dict | None:
+        """Status of a task without loading its message or result, for APIs."""
+        async with engine.connect() as connection:
+            row = (
+                await connection.execute(
+                    select(
+                        TaskRecord.status,
+                        TaskRecord.attempts,
+                        TaskRecord.run_at,
+                        TaskRecord.finished_at,
+                    ).where(TaskRecord.task_id == task_id)
+                )
+            ).first()
+        return row._asdict() if row is not None else None
+
+
+class DatabaseBroker(AsyncBroker):
+    """Durable task queue in the `task_queue` table of the application database.
+
+    `kiq()` inserts a row and sends a NOTIFY in one transaction. Workers
+    (`python main.py worker`, on any number of hosts) wait on LISTEN, claim
+    up to `task_claim_batch` rows with FOR UPDATE SKIP LOCKED and hide them
+    for `task_visibility_timeout` seconds, extended while they run. Tasks of
+    a worker that died are claimed again once that timeout expires.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.result_backend = DatabaseResultBackend()
+        self._wake = asyncio.Event()
+        self._claimed: set[str] = set()
+        self._backlog = False
+        self._maintenance: asyncio.Task | None = None
+
+    async def startup(self):
+        await super().startup()
+        if self.is_worker_process:
+            self._maintenance = asyncio.create_task(self._maintain())
+
+    async def shutdown(self):
+        # Runs after the worker finished its tasks, their claims were kept
+        # alive until now
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+            await asyncio.gather(self._maintenance, return_exceptions=True)
+            self._maintenance = None
+        await super().shutdown()
+
+    async def kick(self, message):
+        statement = (
+            insert(TaskRecord)
+            .values(
+                task_id=message.task_id,
+                task_name=message.task_name,
+                message=message.message,
+                dedup_key=message.labels.get("dedup_key"),
+                run_at=func.now(),
+            )
+            .on_conflict_do_nothing(
+                index_elements=["dedup_key"], index_where=text("status = 'queued'")
+            )
+        )
+        async with engine.begin() as connection:
+            result = await connection.execute(statement)
+            if result.rowcount == 0:
+                task_coalescer.record("deduplicated")
+                return
+            # Delivered on commit
+            await connection.execute(select(func.pg_notify(_CHANNEL, "")))
+
+    def listen(self):
+        raise RuntimeError("Database broker cannot listen, run the worker.")
+
+    async def consume(self, runner: TaskRunner):
+        """Worker side: claim and run tasks until cancelled."""
+        runner.on_done = self._task_done
+        listener = asyncio.create_task(self._listen())
+        logger.info(f"Task worker consuming task_queue with {runner.workers} processes")
+        try:
+            while True:
+                self._wake.clear()
+                limit = min(runner.idle, settings.task_claim_batch)
+                if limit:
+                    try:
+                        claimed = await self._claim(limit)
+                    except Exception as e:
+                        logger.error(f"Failed to claim tasks: {e!r}")
+                        claimed = []
+                    # A full batch means more are probably waiting
+                    self._backlog = len(claimed) == limit
+                    for task_id, data in claimed:
+                        self._claimed.add(task_id)
+                        # Duplicates were already collapsed by the unique index
+                        await runner.put(data, deduplicate=False)
+                    if self._backlog and runner.idle:
+                        continue
+                # Woken by a NOTIFY, a finished task while there is a backlog,
+                # or the poll interval for retries and expired claims
+                try:
+                    await asyncio.wait_for(
+                        self._wake.wait(), settings.task_poll_seconds
+                    )
+                except TimeoutError:
+                    pass
+        finally:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+    def _task_done(self, task_id: str):
+        self._claimed.discard(task_id)
+        if self._backlog:
+            self._wake.set()
+
+    async def _claim(self, limit: int) -> list[tuple[str, bytes]]:
+        ready = (
+            select(TaskRecord.id)
+            .where(
+                TaskRecord.status.in_(("queued", "running")),
+                TaskRecord.run_at <= func.now(),
+                TaskRecord.attempts < settings.task_max_attempts,
+            )
+            .order_by(TaskRecord.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        statement = (
+            update(TaskRecord)
+            .where(TaskRecord.id.in_(ready))
+            .values(
+                status="running",
+                attempts=TaskRecord.attempts + 1,
+                run_at=func.now() + _seconds(settings.task_visibility_timeout),
+            )
+            .returning(TaskRecord.task_id, TaskRecord.message)
+        )
+        async with engine.begin() as connection:
+            return [tuple(row) for row in await connection.execute(statement)]
+
+    async def _listen(self):
+        import psycopg
+
+        # LISTEN needs its own autocommit connection, outside the pool
+        conninfo = str(settings.database_uri).replace("+psycopg", "", 1)
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    conninfo, autocommit=True
+                ) as connection:
+                    await connection.execute(f"LISTEN {_CHANNEL}")
+                    # Catch up on tasks queued while not listening
+                    self._wake.set()
+                    async for _ in connection.notifies():
+                        self._wake.set()
+            except psycopg.Error as e:
+                logger.error(f"Task listener disconnected: {e!r}")
+                await asyncio.sleep(settings.task_poll_seconds)
+
+    async def _maintain(self):
+        """Extend the claims of running tasks, fail abandoned ones, prune results."""
+        while True:
+            await asyncio.sleep(settings.task_visibility_timeout / 3)
+            try:
+                async with engine.begin() as connection:
+                    if self._claimed:
+                        await connection.execute(
+                            update(TaskRecord)
+                            .where(
+                                TaskRecord.task_id.in_(list(self._claimed)),
+                                TaskRecord.status == "running",
+                            )
+                            .values(
+                                run_at=func.now()
+                                + _seconds(settings.task_visibility_timeout)
+                            )
+                        )
+                    await connection.execute(
+                        update(TaskRecord)
+                        .where(
+                            TaskRecord.status == "running",
+                            TaskRecord.run_at < func.now(),
+                            TaskRecord.attempts >= settings.task_max_attempts,
+                        )
+                        .values(status="failed", finished_at=func.now())
+                    )
+                    await connection.execute(
+                        delete(TaskRecord).where(
+                            TaskRecord.finished_at
+                            < func.now() - _seconds(settings.task_result_ttl)
+                        )
+                    )
+            except Exception as e:
+                logger.error(f"Task queue maintenance failed: {e!r}")
+
+
+async def run_worker(workers: int | None = None):
+    """Run tasks from the "queue" or "database" backend until stopped.
+
+    Task modules must already be imported, so the broker can find them.
+    """
+    broker = task_broker.broker
+    if not hasattr(broker, "consume"):
+        raise RuntimeError(f"task_backend '{settings.task_backend}' has no worker")
+    broker.is_worker_process = True
+    runner = TaskRunner(broker, workers)
+    await broker.startup()
+    await runner.start()
+
+    stop = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    except NotImplementedError:
+        pass  # Windows, only Ctrl+C stops the worker
+
+    consumer = asyncio.create_task(broker.consume(runner))
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        await asyncio.wait([consumer, stopped], return_when=asyncio.FIRST_COMPLETED)
+        if consumer.done():
+            consumer.result()  # raises why it stopped, e.g. the port is in use
+    finally:
+        for task in (consumer, stopped):
+            task.cancel()
+        await asyncio.gather(consumer, stopped, return_exceptions=True)
+        logger.info("Task worker stopping, finishing queued tasks...")
+        await runner.stop()
+        await broker.shutdown()
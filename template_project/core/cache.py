@@ -0,0 +1,204 @@
+from collections import OrderedDict
+from pydantic import BaseModel
+from pydantic_core import from_json, to_json
+from sqlmodel import SQLModel
+import time
+
+from .settings import settings
+from .logger import logger
+
+
+class LRUCache:
+    """In-process LRU cache with per-entry TTL and a maximum size."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self._max_size = max_size
+        self._ttl = ttl
+        self._items: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> dict | None:
+        entry = self._items.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: str, value: dict, ttl: float | None = None):
+        self._items[key] = (time.monotonic() + (ttl or self._ttl), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_size:
+            self._items.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._items.pop(key, None)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class CacheBackend:
+    """Shared cache backend interface, values are serialized bytes."""
+
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        raise NotImplementedError
+
+    async def delete(self, keys: list[str]):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Local stand-in for a shared backend, for tests and single-process setups."""
+
+    def __init__(self):
+        self._items: dict[str, tuple[float, bytes]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._items.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self._items.pop(key, None)
+            return None
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        self._items[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, keys: list[str]):
+        for key in keys:
+            self._items.pop(key, None)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Shared backend on Redis, requires the `redis` package."""
+
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("cache_backend 'redis' requires: uv add redis")
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self._client.set(key, value, ex=ttl)
+
+    async def delete(self, keys: list[str]):
+        if keys:
+            await self._client.delete(*keys)
+
+
+def create_backend(name: str, redis_url: str) -> CacheBackend | None:
+    """Backend for a `*_backend` setting: "", "memory" or "redis"."""
+    if name == "memory":
+        return MemoryCacheBackend()
+    if name == "redis":
+        return RedisCacheBackend(redis_url)
+    return None
+
+
+class EntityCache:
+    """Read-through cache of table rows keyed by model and primary key.
+
+    Rows are looked up in the in-process LRU first, then in the shared
+    backend (if configured). Only models registered with `enable` are cached;
+    QueryService invalidates entries on update, delete and bulk writes.
+
+    Invalidation only reaches the LRU of the worker that made the write, so
+    local copies live at most `settings.cache_local_ttl`, with or without a
+    shared backend.
+    """
+
+    def __init__(self, backend: CacheBackend | None = None):
+        self.local = LRUCache(settings.cache_local_size, settings.cache_local_ttl)
+        self.backend = backend
+        # {table name: (ttl, schema rows are cached and read as)}
+        self._models: dict[str, tuple[int, type[BaseModel]]] = {}
+        self.backend_hits = 0
+        self.backend_misses = 0
+
+    def enable(
+        self,
+        model: type[SQLModel],
+        ttl: int | None = None,
+        schema: type[BaseModel] | None = None,
+    ):
+        """Cache rows of `model`.
+
+        With `schema` (the public read schema), only its fields are cached and
+        cache reads return it instead of the table model, so columns such as
+        password hashes never reach the cache. Without it the whole row is.
+        """
+        self._models[model.__tablename__] = (ttl or settings.cache_ttl, schema or model)
+        logger.info(f"Entity cache enabled for: {model.__tablename__}")
+
+    def is_enabled(self, model: type[SQLModel]) -> bool:
+        return model.__tablename__ in self._models
+
+    def schema(self, model: type[SQLModel]) -> type[BaseModel]:
+        return self._models[model.__tablename__][1]
+
+    @staticmethod
+    def _key(model: type[SQLModel], item_id) -> str:
+        return f"entity:{model.__tablename__}:{item_id}"
+
+    async def get(self, model: type[SQLModel], item_id) -> dict | None:
+        key = self._key(model, item_id)
+        data = self.local.get(key)
+        if data is not None or self.backend is None:
+            return data
+
+        value = await self.backend.get(key)
+        if value is None:
+            self.backend_misses += 1
+            return None
+        self.backend_hits += 1
+        data = from_json(value)
+        self.local.set(key, data, settings.cache_local_ttl)
+        return data
+
+    async def set(self, model: type[SQLModel], item_id, data: dict):
+        key = self._key(model, item_id)
+        ttl = self._models[model.__tablename__][0]
+        # Other workers cannot invalidate this process's LRU, so the local
+        # copy only lives for a short time
+        self.local.set(key, data, min(ttl, settings.cache_local_ttl))
+        if self.backend is not None:
+            await self.backend.set(key, to_json(data), ttl)
+
+    async def invalidate(self, model: type[SQLModel], item_ids: list):
+        keys = [self._key(model, item_id) for item_id in item_ids]
+        for key in keys:
+            self.local.delete(key)
+        if self.backend is not None:
+            await self.backend.delete(keys)
+
+    def status(self) -> dict:
+        return {
+            "models": list(self._models),
+            "size": len(self.local),
+            "hits": self.local.hits,
+            "misses": self.local.misses,
+            "evictions": self.local.evictions,
+            "backend_hits": self.backend_hits,
+            "backend_misses": self.backend_misses,
+        }
+
+
+entity_cache = EntityCache(
+    create_backend(settings.cache_backend, settings.cache_redis_url)
+)
@@ -0,0 +1,269 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import anyio.to_thread
+import time
+import zlib
+
+from .logger import logger
+
+# Already compressed, or streams where buffering by the compressor hurts
+EXCLUDED_CONTENT_TYPES = (
+    "application/gzip",
+    "application/x-gzip",
+    "application/zip",
+    "application/zstd",
+    "application/grpc",
+    "audio/*",
+    "font/woff",
+    "font/woff2",
+    "image/avif",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+    "text/event-stream",
+    "video/*",
+)
+
+
+class GzipCodec:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        flush = zlib.Z_FINISH if finish else zlib.Z_SYNC_FLUSH
+        return self._compressor.compress(data) + self._compressor.flush(flush)
+
+
+class BrotliCodec:
+    def __init__(self, level: int):
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        if finish:
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.process(data) + self._compressor.flush()
+
+
+class ZstdCodec:
+    def __init__(self, level: int):
+        import zstandard
+
+        self._flush_block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._flush_finish = zstandard.COMPRESSOBJ_FLUSH_FINISH
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, finish: bool) -> bytes:
+        flush = self._flush_finish if finish else self._flush_block
+        return self._compressor.compress(data) + self._compressor.flush(flush)
+
+
+CODECS = {"zstd": ZstdCodec, "br": BrotliCodec, "gzip": GzipCodec}
+_REQUIREMENTS = {"zstd": "zstandard", "br": "brotli"}
+
+
+class CompressionStats:
+    def __init__(self):
+        self._stats: dict[str, dict] = {}
+
+    def record(self, encoding: str, size_in: int, size_out: int, seconds: float):
+        stats = self._stats.setdefault(
+            encoding, {"responses": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+        )
+        stats["responses"] += 1
+        stats["bytes_in"] += size_in
+        stats["bytes_out"] += size_out
+        stats["seconds"] += seconds
+
+    def status(self) -> dict:
+        return {
+            encoding: {
+                "responses": stats["responses"],
+                "bytes_in": stats["bytes_in"],
+                "bytes_out": stats["bytes_out"],
+                "ratio": round(stats["bytes_in"] / stats["bytes_out"], 2)
+                if stats["bytes_out"]
+                else None,
+                "time_ms": round(stats["seconds"] * 1000, 3),
+            }
+            for encoding, stats in self._stats.items()
+        }
+
+
+compression_stats = CompressionStats()
+
+
+def compression_status() -> dict:
+    return compression_stats.status()
+
+
+def negotiate_encoding(accept_encoding: str, encodings: list[str]) -> str | None:
+    """Pick the encoding with the highest q-value, ties go to the server order."""
+    weights = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            weights[name.strip()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = weights.get(encoding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def available_encodings(encodings: list[str]) -> list[str]:
+    """Configured encodings whose compression library can be imported."""
+    result = []
+    for encoding in encodings:
+        if encoding not in CODECS:
+            logger.warning(f"Unknown compression encoding: {encoding}")
+            continue
+        try:
+            CODECS[encoding](1)
+        except ImportError:
+            logger.warning(
+                f"Compression '{encoding}' disabled, requires: "
+                f"uv add {_REQUIREMENTS[encoding]}"
+            )
+            continue
+        result.append(encoding)
+    return result
+
+
+class CompressionMiddleware:
+    """Compress responses with zstd, brotli or gzip from `Accept-Encoding`.
+
+    Streaming responses are compressed chunk by chunk and flushed, so the
+    client still receives data as it is produced. Bodies over
+    `thread_minimum_size` are compressed in a worker thread to keep the event
+    loop free.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        encodings: list[str],
+        levels: dict[str, int],
+        minimum_size: int = 2000,
+        thread_minimum_size: int = 128 * 1024,
+        exclude_content_types: tuple[str, ...] = EXCLUDED_CONTENT_TYPES,
+    ):
+        self.app = app
+        self.encodings = available_encodings(encodings)
+        self.levels = levels
+        self.minimum_size = minimum_size
+        self.thread_minimum_size = thread_minimum_size
+        self.exclude_content_types = set(exclude_content_types)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate_encoding(accept_encoding, self.encodings)
+        responder = _Responder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _Responder:
+    def __init__(
+        self, middleware: CompressionMiddleware, encoding: str | None, send: Send
+    ):
+        self._middleware = middleware
+        self._encoding = encoding
+        self._send = send
+        self._start: Message | None = None
+        self._passthrough = False
+        self._started = False
+        self._codec = None
+        self._size_in = 0
+        self._size_out = 0
+        self._seconds = 0.0
+
+    def _is_excluded(self, headers: Headers, status: int) -> bool:
+        if "content-encoding" in headers or status == 206:
+            return True
+        media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+        excluded = self._middleware.exclude_content_types
+        return media_type in excluded or f"{media_type.partition('/')[0]}/*" in excluded
+
+    async def send(self, message: Message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Held back until the first body chunk decides the headers
+            self._start = message
+            headers = Headers(raw=message["headers"])
+            self._passthrough = self._is_excluded(headers, message["status"])
+            if self._passthrough:
+                await self._send(message)
+        elif message_type != "http.response.body" or self._passthrough:
+            if not (self._started or self._passthrough or self._start is None):
+                self._started = True
+                await self._send(self._start)
+            await self._send(message)
+        elif not self._started:
+            self._started = True
+            await self._send_first(message)
+        else:
+            await self._send_chunk(message)
+
+    async def _send_first(self, message: Message):
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self._start["headers"])
+        if not more_body and len(body) < self._middleware.minimum_size:
+            await self._send(self._start)
+            await self._send(message)
+            return
+
+        headers.add_vary_header("Accept-Encoding")
+        if self._encoding is None:
+            await self._send(self._start)
+            await self._send(message)
+            return
+
+        level = self._middleware.levels[self._encoding]
+        self._codec = CODECS[self._encoding](level)
+        message["body"] = await self._compress(body, not more_body)
+        headers["Content-Encoding"] = self._encoding
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(message["body"]))
+        await self._send(self._start)
+        await self._send(message)
+
+    async def _send_chunk(self, message: Message):
+        if self._codec is not None:
+            body = message.get("body", b"")
+            finish = not message.get("more_body", False)
+            message["body"] = await self._compress(body, finish)
+        await self._send(message)
+
+    async def _compress(self, body: bytes, finish: bool) -> bytes:
+        start = time.perf_counter()
+        if len(body) >= self._middleware.thread_minimum_size:
+            data = await anyio.to_thread.run_sync(self._codec.compress, body, finish)
+        else:
+            data = self._codec.compress(body, finish)
+        self._seconds += time.perf_counter() - start
+        self._size_in += len(body)
+        self._size_out += len(data)
+        if finish:
+            compression_stats.record(
+                self._encoding, self._size_in, self._size_out, self._seconds
+            )
+        return data
@@ -1,8 +1,9 @@
-from fastapi import Depends
+from fastapi import Depends, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Annotated, TypeAlias
+from typing import Annotated, List, TypeAlias
 from .session import get_session
-from .schema import PaginationInput
+from .schema import PaginationInput, CursorPaginationInput
+from .etag import ETagContext
 
 Session: TypeAlias = Annotated[AsyncSession, Depends(get_session)]
 
@@ -15,3 +16,33 @@ def get_pagination_info(page_index: int | None = None, page_size: int | None = N
 
 
 Pagination = Annotated[PaginationInput, Depends(get_pagination_info)]
+
+
+def get_cursor_pagination_info(cursor: str | None = None, page_size: int | None = None):
+    return CursorPaginationInput(
+        cursor=cursor if cursor else None,
+        page_size=page_size if page_size else 20,
+    )
+
+
+CursorPagination = Annotated[CursorPaginationInput, Depends(get_cursor_pagination_info)]
+
+
+def get_etag_context(request: Request, response: Response):
+    return ETagContext(request, response)
+
+
+ETag = Annotated[ETagContext, Depends(get_etag_context)]
+
+
+def get_fields(
+    fields: str | None = Query(
+        default=None, description="Comma separated fields to return, all if empty"
+    ),
+):
+    if not fields:
+        return None
+    return [name.strip() for name in fields.split(",") if name.strip()] or None
+
+
+Fields = Annotated[List[str] | None, Depends(get_fields)]
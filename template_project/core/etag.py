@@ -0,0 +1,60 @@
+from fastapi import Request, Response
+from pydantic_core import to_json
+from sqlalchemy import inspect
+from sqlmodel import SQLModel
+import hashlib
+
+from .exception import NotModifiedException
+
+
+class ETagContext:
+    """Per-request ETag handling for conditional GET.
+
+    `check` sets the ETag header on the response and raises a 304 when the
+    client already holds that version (`If-None-Match`).
+    """
+
+    def __init__(self, request: Request, response: Response):
+        self._response = response
+        self.value: str | None = None
+        header = request.headers.get("if-none-match", "")
+        # Weak comparison, as required for If-None-Match
+        self._if_none_match = {
+            tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()
+        }
+
+    def check(self, etag: str):
+        self.value = etag
+        self._response.headers["ETag"] = etag
+        if "*" in self._if_none_match or etag in self._if_none_match:
+            raise NotModifiedException(etag)
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b(to_json(parts, fallback=str), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+
+def version_column(model: type[SQLModel]):
+    """Column that changes on every write: the mapper's version_id_col, a
+    `version` column or an `updated_at` column, in that order."""
+    mapper = inspect(model)
+    if mapper.version_id_col is not None:
+        return mapper.version_id_col
+    columns = model.__table__.c
+    for name in ("version", "updated_at"):
+        if name in columns:
+            return columns[name]
+    return None
+
+
+def items_etag(model: type[SQLModel], items: list, *extra) -> str:
+    """ETag of a list of rows, from (primary key, version) pairs when the model
+    has a version column, otherwise from the row contents."""
+    column = version_column(model)
+    if column is None:
+        parts = [item.model_dump(mode="json") for item in items]
+    else:
+        key = inspect(model).primary_key[0].key
+        parts = [(getattr(item, key), getattr(item, column.key)) for item in items]
+    return make_etag(model.__tablename__, parts, *extra)
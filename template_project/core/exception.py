@@ -19,3 +19,17 @@ class PermissionDeniedException(HTTPException):
 class NotFoundException(HTTPException):
     def __init__(self, detail: str = "Not found"):
         super().__init__(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+
+
+class NotModifiedException(HTTPException):
+    def __init__(self, etag: str):
+        super().__init__(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+
+
+class ServiceUnavailableException(HTTPException):
+    def __init__(self, detail: str = "Service unavailable"):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail
+        )
@@ -0,0 +1,497 @@
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Iterable
+from uuid import uuid4
+import asyncio
+import atexit
+import glob
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from pydantic_core import from_json, to_json
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import settings
+from .logger import logger
+
+UNMATCHED = "<unmatched>"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# A sample is (family, type, series name, labels, value), e.g.
+# ("http_requests_total", "counter", "http_requests_total", 'status="200"', 3)
+Sample = tuple[str, str, str, str, float]
+
+# {name: (status function, label for its top-level keys, counter keys)}
+_collectors: dict[str, tuple[Callable[[], dict], str | None, frozenset]] = {}
+
+
+def register_collector(
+    name: str,
+    collect: Callable[[], dict],
+    label: str | None = None,
+    counters: Iterable[str] = (),
+):
+    """Expose a status function as metrics named `<name>_<key>`.
+
+    Nested dicts are flattened into the name. With `label`, the top-level
+    keys become values of that label instead, e.g. one series per encoding.
+    Keys in `counters` (flattened, e.g. "coalesced_batches") only ever grow
+    and are exported as `<name>_<key>_total` counters, the rest as gauges.
+    """
+    _collectors[name] = (collect, label, frozenset(counters))
+
+
+class RouteMetrics:
+    __slots__ = ("buckets", "sum", "statuses", "request_bytes", "response_bytes")
+
+    def __init__(self, size: int):
+        self.buckets = [0] * size
+        self.sum = 0.0
+        self.statuses: dict[int, int] = {}
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class RequestMetrics:
+    """Latency histogram, status and size counters per (method, route template)."""
+
+    def __init__(self, buckets: list[float]):
+        self.buckets = sorted(buckets)
+        self.in_flight = 0
+        self._routes: dict[tuple[str, str], RouteMetrics] = {}
+
+    def record(
+        self,
+        method: str,
+        route: str,
+        status: int,
+        seconds: float,
+        request_bytes: int,
+        response_bytes: int,
+    ):
+        metrics = self._routes.get((method, route))
+        if metrics is None:
+            metrics = self._routes[(method, route)] = RouteMetrics(
+                len(self.buckets) + 1
+            )
+        metrics.buckets[bisect_left(self.buckets, seconds)] += 1
+        metrics.sum += seconds
+        metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+        metrics.request_bytes += request_bytes
+        metrics.response_bytes += response_bytes
+
+    def samples(self) -> list[Sample]:
+        samples = [
+            (
+                "http_requests_in_flight",
+                "gauge",
+                "http_requests_in_flight",
+                "",
+                self.in_flight,
+            )
+        ]
+        histogram = "http_request_duration_seconds"
+        bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+        for (method, route), metrics in self._routes.items():
+            labels = f'method="{method}",route="{_escape(route)}"'
+            count = 0
+            for bound, bucket in zip(bounds, metrics.buckets):
+                count += bucket
+                samples.append(
+                    (
+                        histogram,
+                        "histogram",
+                        f"{histogram}_bucket",
+                        f'{labels},le="{bound}"',
+                        count,
+                    )
+                )
+            samples.append(
+                (histogram, "histogram", f"{histogram}_sum", labels, metrics.sum)
+            )
+            samples.append(
+                (histogram, "histogram", f"{histogram}_count", labels, count)
+            )
+
+            for status, total in sorted(metrics.statuses.items()):
+                samples.append(
+                    (
+                        "http_requests_total",
+                        "counter",
+                        "http_requests_total",
+                        f'{labels},status="{status}"',
+                        total,
+                    )
+                )
+            for name in ("request_bytes", "response_bytes"):
+                family = f"http_{name}_total"
+                samples.append(
+                    (family, "counter", family, labels, getattr(metrics, name))
+                )
+        return samples
+
+
+request_metrics = RequestMetrics(settings.metrics_buckets)
+
+
+class _Exchange:
+    """Status, timing and sizes of one request, as it is received and sent."""
+
+    # Slots rather than closures over nonlocal counters, this runs per request
+    __slots__ = (
+        "_receive",
+        "_send",
+        "server_timing",
+        "start",
+        "status",
+        "request_bytes",
+        "response_bytes",
+    )
+
+    def __init__(self, receive: Receive, send: Send, server_timing: bool):
+        self._receive = receive
+        self._send = send
+        self.server_timing = server_timing
+        self.start = perf_counter()
+        self.status = 500
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+    async def receive(self) -> Message:
+        message = await self._receive()
+        self.request_bytes += len(message.get("body", b""))
+        return message
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.body":
+            self.response_bytes += len(message.get("body", b""))
+        elif message["type"] == "http.response.start":
+            self.status = message["status"]
+            if self.server_timing:
+                elapsed = (perf_counter() - self.start) * 1000
+                headers = list(message.get("headers", ()))
+                headers.append((b"server-timing", b"app;dur=%.1f" % elapsed))
+                message["headers"] = headers
+        await self._send(message)
+
+
+class MetricsMiddleware:
+    """Record every HTTP request in `request_metrics`.
+
+    Routes are keyed by their full template ("/api/user/{user_id}"), so the
+    number of series stays bounded; requests matching no route share one
+    entry. Response sizes are counted as sent, after compression.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+        # {id(route): full path template}, filled from the app's routes on
+        # the first matched request; routes compare by value, not identity
+        self._paths: dict[int, str] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metrics = request_metrics
+        metrics.in_flight += 1
+        exchange = _Exchange(receive, send, self.server_timing)
+        try:
+            await self.app(scope, exchange.receive, exchange.send)
+        finally:
+            metrics.in_flight -= 1
+            # Known routes are one lookup, the rest resolve through the app
+            route = self._paths.get(id(scope.get("route")))
+            if route is None or scope.get("root_path"):
+                route = self._route_template(scope)
+            metrics.record(
+                scope["method"],
+                route,
+                exchange.status,
+                perf_counter() - exchange.start,
+                exchange.request_bytes,
+                exchange.response_bytes,
+            )
+
+    def _route_template(self, scope: Scope) -> str:
+        route = scope.get("route")
+        if route is None:
+            # Plain routes (docs, openapi, metrics) are matched without setting
+            # "route"; their path is only safe as a label when it has no parameters
+            if "endpoint" in scope and not scope.get("path_params"):
+                return scope.get("root_path", "") + scope["path"]
+            return UNMATCHED
+
+        paths = self._paths
+        if not paths:
+            routes = getattr(scope.get("app"), "routes", ())
+            paths = self._paths = _route_paths(routes)
+        path = paths.get(id(route))
+        if path is None:
+            path = paths[id(route)] = route.path_format
+        root_path = scope.get("root_path")
+        return root_path + path if root_path else path
+
+
+def _route_paths(routes: Iterable) -> dict[int, str]:
+    """Full path template of every route by `id()` of the route object.
+
+    An included router's routes only know their path within the router, the
+    prefixes they are included under are kept on the app's route list.
+    """
+    paths: dict[int, str] = {}
+    for route in routes:
+        contexts = getattr(route, "effective_route_contexts", None)
+        if contexts is not None:
+            for context in contexts():
+                paths.setdefault(id(context.original_route), context.path_format)
+        elif hasattr(route, "path_format"):
+            paths.setdefault(id(route), route.path_format)
+    return paths
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    if isinstance(value, int):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _metric_name(*parts: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", "_".join(parts))
+
+
+def _flatten(
+    name: str,
+    data: dict,
+    labels: str,
+    counters: frozenset,
+    samples: list[Sample],
+    path: tuple[str, ...] = (),
+):
+    for key, value in data.items():
+        if isinstance(value, dict):
+            _flatten(name, value, labels, counters, samples, (*path, key))
+        elif isinstance(value, (int, float)):
+            metric = _metric_name(name, *path, key)
+            if "_".join((*path, key)) in counters:
+                metric = metric if metric.endswith("_total") else f"{metric}_total"
+                samples.append((metric, "counter", metric, labels, value))
+            else:
+                samples.append((metric, "gauge", metric, labels, value))
+
+
+def collect_samples() -> list[Sample]:
+    """Samples of the request metrics and every registered collector."""
+    samples = request_metrics.samples()
+    for name, (collect, label, counters) in _collectors.items():
+        try:
+            status = collect()
+        except Exception as e:
+            logger.error(f"Metrics collector {name} failed: {e!r}")
+            continue
+
+        if label is None:
+            _flatten(name, status, "", counters, samples)
+            continue
+        for key, value in status.items():
+            labels = f'{label}="{_escape(str(key))}"'
+            if isinstance(value, dict):
+                _flatten(name, value, labels, counters, samples)
+            elif isinstance(value, (int, float)):
+                samples.append((name, "gauge", name, labels, value))
+    return samples
+
+
+def render_samples(samples: Iterable[Sample]) -> str:
+    """Prometheus text format, the series of each family grouped together."""
+    families: dict[str, tuple[str, list[str]]] = {}
+    for family, kind, name, labels, value in samples:
+        entry = families.get(family)
+        if entry is None:
+            entry = families[family] = (kind, [])
+        series = f"{name}{{{labels}}}" if labels else name
+        entry[1].append(f"{series} {_number(value)}")
+
+    lines = []
+    for family, (kind, series) in families.items():
+        lines.append(f"# TYPE {family} {kind}")
+        lines.extend(series)
+    return "\n".join(lines) + "\n"
+
+
+class SharedMetrics:
+    """Metrics of every `serve --prod` worker, exchanged through files.
+
+    Each worker writes its samples to `settings.metrics_dir` every
+    `metrics_flush_seconds`, and once more before it answers a scrape, so
+    whichever worker Prometheus reaches reports all of them. Counters and
+    histograms are summed over every file written since the server started,
+    recycled workers included, so they never go down between scrapes.
+    Gauges are reported per live worker, with a `worker` label.
+    """
+
+    def __init__(self):
+        self._path: str | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(settings.metrics_url and settings.metrics_dir)
+
+    def write(self):
+        if self._path is None:
+            # pid plus a random part, a new worker may reuse a dead one's pid
+            self._path = os.path.join(
+                settings.metrics_dir, f"{os.getpid()}-{uuid4().hex[:8]}.json"
+            )
+        data = to_json({"pid": os.getpid(), "samples": collect_samples()})
+        temporary = f"{self._path}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, self._path)
+
+    def read(self) -> list[Sample]:
+        self.write()
+        live_after = time.time() - 3 * settings.metrics_flush_seconds
+        # {(series name, labels): summed sample}
+        totals: dict[tuple[str, str], list] = {}
+        gauges: list[Sample] = []
+        for path in glob.glob(os.path.join(settings.metrics_dir, "*.json")):
+            try:
+                live = os.path.getmtime(path) >= live_after
+                with open(path, "rb") as f:
+                    data = from_json(f.read())
+            except (OSError, ValueError):
+                continue  # replaced or removed while reading
+
+            worker = f'worker="{data["pid"]}"'
+            for family, kind, name, labels, value in data["samples"]:
+                if kind == "gauge":
+                    if live:
+                        labels = f"{labels},{worker}" if labels else worker
+                        gauges.append((family, kind, name, labels, value))
+                    continue
+                total = totals.get((name, labels))
+                if total is None:
+                    totals[(name, labels)] = [family, kind, name, labels, value]
+                else:
+                    total[4] += value
+        return [*map(tuple, totals.values()), *gauges]
+
+    async def start(self):
+        if self.enabled:
+            self.write()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.write()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.metrics_flush_seconds)
+            try:
+                self.write()
+            except Exception as e:
+                logger.error(f"Failed to write metrics: {e!r}")
+
+
+shared_metrics = SharedMetrics()
+
+
+def prepare_metrics_dir() -> str:
+    """Set up the directory `serve --prod` workers share metrics through.
+
+    Files of an earlier run are removed. Without `settings.metrics_dir` a
+    temporary directory is used, removed again when the server exits.
+    Workers inherit it through the environment.
+    """
+    directory = settings.metrics_dir
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.json*")):
+            os.remove(path)
+    else:
+        directory = tempfile.mkdtemp(prefix="metrics-")
+        atexit.register(shutil.rmtree, directory, True)
+    settings.metrics_dir = os.environ["METRICS_DIR"] = directory
+    return directory
+
+
+async def metrics_endpoint(request: Request):
+    samples = shared_metrics.read() if shared_metrics.enabled else collect_samples()
+    return PlainTextResponse(render_samples(samples), media_type=CONTENT_TYPE)
+
+
+def setup_metrics(app: FastAPI):
+    """Add the metrics middleware, outermost, and the Prometheus endpoint."""
+    if not settings.metrics_url:
+        return
+
+    from .session import pool_status
+    from .task import task_status
+    from .compression import compression_status
+    from .cache import entity_cache
+    from .singleflight import single_flight
+    from .startup import startup_timer
+
+    register_collector(
+        "db_pool",
+        pool_status,
+        counters=("wait_count", "wait_time_total", "timeout_count"),
+    )
+    register_collector(
+        "task",
+        task_status,
+        counters=(
+            "completed",
+            "failed",
+            "rejected",
+            "coalesced_deduplicated",
+            "coalesced_debounced",
+            "coalesced_batches",
+            "coalesced_batched",
+            "coalesced_cache_hits",
+            "coalesced_cache_misses",
+            "coalesced_shared_results",
+        ),
+    )
+    register_collector(
+        "compression",
+        compression_status,
+        label="encoding",
+        counters=("responses", "bytes_in", "bytes_out", "time_ms"),
+    )
+    register_collector(
+        "entity_cache",
+        entity_cache.status,
+        counters=("hits", "misses", "evictions", "backend_hits", "backend_misses"),
+    )
+    register_collector(
+        "single_flight", single_flight.status, counters=("executed", "coalesced")
+    )
+    register_collector(
+        "startup_phase_ms", lambda: startup_timer.status()["phases_ms"], label="phase"
+    )
+
+    logger.info("Adding metrics middleware")
+    app.add_middleware(MetricsMiddleware, server_timing=settings.metrics_server_timing)
+    app.add_route(settings.metrics_url, metrics_endpoint, include_in_schema=False)
@@ -1,9 +1,9 @@
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
 from fastapi import FastAPI
 
 from .settings import settings
 from .logger import logger
+from .compression import CompressionMiddleware
 
 
 def setup_middleware(app: FastAPI):
@@ -18,11 +18,17 @@ def setup_middleware(app: FastAPI):
         allow_headers=settings.cors_allow_headers,
     )
 
-    logger.info("Adding GZip middleware")
+    logger.info("Adding compression middleware")
     app.add_middleware(
-        GZipMiddleware,
-        minimum_size=settings.gzip_minimum_size,
-        compresslevel=settings.gzip_compress_level,
+        CompressionMiddleware,
+        encodings=settings.compression_encodings,
+        levels={
+            "zstd": settings.compression_zstd_level,
+            "br": settings.compression_brotli_level,
+            "gzip": settings.compression_gzip_level,
+        },
+        minimum_size=settings.compression_minimum_size,
+        thread_minimum_size=settings.compression_thread_minimum_size,
     )
 
     logger.info("All middlewares loaded successfully.")
@@ -0,0 +1,46 @@
+from pathlib import Path
+from fastapi import FastAPI
+import json
+
+from .logger import logger
+from .settings import settings
+
+source_path = Path(__file__).parent.parent
+
+
+def openapi_options() -> dict:
+    """FastAPI arguments for the document URLs, all None when disabled."""
+    if settings.openapi_mode == "disabled":
+        return {"openapi_url": None, "docs_url": None, "redoc_url": None}
+    return {
+        "openapi_url": settings.openapi_url,
+        "docs_url": settings.docs_url,
+        "redoc_url": settings.redoc_url,
+    }
+
+
+def setup_openapi(app: FastAPI):
+    if settings.openapi_mode != "file":
+        return
+
+    openapi_path = source_path / settings.openapi_file
+    if not openapi_path.exists():
+        logger.warning(
+            f"OpenAPI file {openapi_path} not found, generating on first request. "
+            "Run `python main.py openapi` at build time."
+        )
+        return
+
+    schema = json.loads(openapi_path.read_bytes())
+    app.openapi = lambda: schema
+    logger.info(f"Serving OpenAPI document from: {openapi_path}")
+
+
+def write_openapi(app: FastAPI, output: str | None = None) -> Path:
+    """Generate the OpenAPI document of `app` and write it to disk."""
+    openapi_path = source_path / (output or settings.openapi_file)
+    # Bypass a file-serving override installed by setup_openapi
+    app.openapi_schema = None
+    schema = FastAPI.openapi(app)
+    openapi_path.write_text(json.dumps(schema, ensure_ascii=False), encoding="utf-8")
+    return openapi_path
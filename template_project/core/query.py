@@ -1,56 +1,503 @@
 from sqlmodel import SQLModel, select, func
+from sqlalchemy import (
+    and_,
+    or_,
+    inspect,
+    text,
+    tuple_,
+    insert,
+    update,
+    delete,
+    values,
+    column,
+)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import load_only
 from fastapi_filter.contrib.sqlalchemy import Filter
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic_core import to_jsonable_python
+from typing import List
+import base64
+import json
 import math
-from core.exception import NotFoundException
-from .schema import PaginationData, PaginationInput, GeneralResponse
+import time
+from core.exception import BadRequestException, NotFoundException
+from .schema import (
+    PaginationData,
+    PaginationInput,
+    CursorPaginationData,
+    CursorPaginationInput,
+    CountStrategy,
+    BulkItemResult,
+    BulkResult,
+    BulkUpdateItem,
+    GeneralResponse,
+)
 from .dependency import Session
+from .settings import settings
+from .cache import entity_cache
+from .singleflight import single_flight
+from .etag import ETagContext, make_etag, items_etag, version_column
+from .response import trusted_response
+
+# {compiled statement and params: (expire time, total count)}
+_count_cache: dict[str, tuple[float, int]] = {}
+
+
+def _encode_cursor(keys: list[str], values: list) -> str:
+    payload = json.dumps({"k": keys, "v": to_jsonable_python(values)})
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, keys: list[str]) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded))
+        values = payload["v"]
+    except (ValueError, TypeError, KeyError):
+        raise BadRequestException(detail="Cursor is invalid.")
+
+    # A cursor is only valid for the ordering it was issued with
+    if payload.get("k") != keys or len(values) != len(keys):
+        raise BadRequestException(detail="Cursor does not match the ordering.")
+    return values
+
+
+def _filter_key(filter: Filter) -> str:
+    """Normalized filter values, equal for filters that select the same rows."""
+    values = json.dumps(filter.model_dump(exclude_none=True), sort_keys=True, default=str)
+    return f"{type(filter).__qualname__}:{values}"
+
+
+def _cursor_keys(model: SQLModel, filter: Filter) -> list[tuple[str, bool]]:
+    """Build the (column name, descending) keys used for keyset pagination."""
+    keys: list[tuple[str, bool]] = []
+    if getattr(filter, filter.Constants.ordering_field_name, None):
+        for value in filter.ordering_values:
+            keys.append((value.lstrip("+-"), value.startswith("-")))
+
+    # Always end with the primary key so the ordering is unique
+    names = [name for name, _ in keys]
+    for column in inspect(model).primary_key:
+        if column.key not in names:
+            keys.append((column.key, False))
+    return keys
+
+
+def _cursor_condition(keys: list[tuple[str, bool]], columns: list, values: list):
+    directions = {desc for _, desc in keys}
+    if len(directions) == 1:
+        # Same direction for every key: a row comparison can use a
+        # composite index directly
+        if directions.pop():
+            return tuple_(*columns) < tuple_(*values)
+        return tuple_(*columns) > tuple_(*values)
+
+    # Mixed directions: (a > x) OR (a = x AND b < y) OR ...
+    conditions = []
+    for index, ((_, desc), column, value) in enumerate(zip(keys, columns, values)):
+        equals = [columns[i] == values[i] for i in range(index)]
+        compare = column < value if desc else column > value
+        conditions.append(and_(*equals, compare))
+    return or_(*conditions)
 
 
 class QueryService[T]:
-    def __init__(self, session: Session, model: SQLModel):
+    def __init__(
+        self,
+        session: Session,
+        model: SQLModel,
+        returning: bool | None = None,
+        coalesce: bool | None = None,
+        schema: type[BaseModel] | None = None,
+        fields: List[str] | None = None,
+    ):
+        """
+        Args:
+            returning (bool): Send create/update/delete as a single
+                INSERT/UPDATE/DELETE ... RETURNING statement instead of the ORM
+                get/flush/refresh sequence, defaults to `settings.query_returning_writes`
+            coalesce (bool): Let identical concurrent read/list calls share one
+                query, defaults to `settings.query_coalesce_reads`
+            schema (type[BaseModel]): Read schema for the trusted serialization
+                path: read/list/cursor_list return a FastJSONResponse serialized
+                through this schema once, skipping response model validation
+            fields (List[str]): Sparse fieldset of `schema`, read/list/cursor_list
+                load only these columns (plus keys) and return only these fields
+        """
         self._session = session
         self._model = model
+        self._schema = schema
+        self._fields = self._check_fields(fields)
+        self._returning = (
+            settings.query_returning_writes if returning is None else returning
+        )
+        self._coalesce = settings.query_coalesce_reads if coalesce is None else coalesce
+
+    def _check_fields(self, fields: List[str] | None) -> tuple[str, ...] | None:
+        if not fields:
+            return None
+        if self._schema is None:
+            raise ValueError("fields requires the read schema to be set")
+        allowed = self._schema.model_fields
+        unknown = [name for name in fields if name not in allowed]
+        if unknown:
+            raise BadRequestException(
+                f"Unknown fields: {', '.join(unknown)}. "
+                f"Allowed: {', '.join(allowed)}"
+            )
+        return tuple(dict.fromkeys(fields))
+
+    def _select(self, *keys: str):
+        """`select(model)`, narrowed to the requested fields plus `keys`."""
+        statement = select(self._model)
+        if self._fields is None:
+            return statement
+
+        columns = inspect(self._model).column_attrs.keys()
+        names = [name for name in (*self._fields, *keys) if name in columns]
+        version = version_column(self._model)
+        if version is not None:
+            names.append(version.key)
+        # Primary key columns are always loaded by load_only
+        return statement.options(
+            load_only(*(getattr(self._model, name) for name in dict.fromkeys(names)))
+        )
+
+    @property
+    def _etag_fields(self) -> tuple[str, ...] | None:
+        # Responses list fields in schema order, whatever order was requested
+        return tuple(sorted(self._fields)) if self._fields else None
+
+    def _flight_key(self, operation: str, *args) -> tuple:
+        return (self._model.__tablename__, operation, self._fields, *args)
+
+    async def _attach(self, items: list) -> list:
+        """Rows of a coalesced call, as instances of this service's session.
+
+        The shared call ran on the session of the caller that started it,
+        which may be closed before the others serialize or lazy-load. Merging
+        without loading copies the loaded state and sends no query.
+        """
+        attached = []
+        for item in items:
+            state = inspect(item, raiseerr=False)
+            if state is not None and state.has_identity:
+                item = await self._session.merge(item, load=False)
+            attached.append(item)
+        return attached
+
+    def _respond(self, result, etag: ETagContext | None):
+        if self._schema is None:
+            return result
+        # A returned Response does not pick up headers set on the injected one
+        headers = {"ETag": etag.value} if etag and etag.value else None
+        return trusted_response(result, self._schema, headers, self._fields)
 
     async def create(self, item_in: T):
+        if self._returning:
+            row = self._model(**item_in.model_dump()).model_dump()
+            item = (await self._insert_rows([row]))[0]
+            await self._session.commit()
+            return item
+
         item = self._model(**item_in.dict())
         self._session.add(item)
         await self._session.commit()
         await self._session.refresh(item)
         return item
 
-    async def read(self, item_id):
+    async def read(self, item_id, etag: ETagContext | None = None):
+        """Read one item.
+
+        Args:
+            etag (ETagContext): Answer `If-None-Match` with 304. Models with a
+                version column are checked with a version-only query before the
+                row is loaded, others are compared by row content
+        """
+        column = version_column(self._model) if etag else None
+        if column is not None:
+            result = await self._session.execute(
+                select(column).where(self._primary_key() == item_id)
+            )
+            row = result.one_or_none()
+            if row is None:
+                raise NotFoundException()
+            etag.check(
+                make_etag(
+                    self._model.__tablename__, item_id, row[0], self._etag_fields
+                )
+            )
+
+        if self._coalesce:
+            item = await single_flight.do(
+                self._flight_key("read", item_id), lambda: self._read(item_id)
+            )
+            item = (await self._attach([item]))[0]
+        else:
+            item = await self._read(item_id)
+
+        if etag and column is None:
+            etag.check(items_etag(self._model, [item], self._etag_fields))
+        return self._respond(item, etag)
+
+    async def _read(self, item_id):
+        cached = entity_cache.is_enabled(self._model)
+        if cached:
+            schema = entity_cache.schema(self._model)
+            data = await entity_cache.get(self._model, item_id)
+            if data is not None:
+                return schema.model_validate(data)
+
+        if self._fields is not None:
+            # Partial rows are never put in the cache
+            result = await self._session.execute(
+                self._select().where(self._primary_key() == item_id)
+            )
+            item = result.scalar_one_or_none()
+            if item is None:
+                raise NotFoundException()
+            return item
+
         item = await self._session.get(self._model, item_id)
         if not item:
             raise NotFoundException()
+        if cached:
+            # Returned as cached, so hits and misses look the same to callers
+            if schema is not self._model:
+                item = schema.model_validate(item, from_attributes=True)
+            await entity_cache.set(self._model, item_id, item.model_dump(mode="json"))
         return item
 
-    async def list(self, page: PaginationInput, filter: Filter) -> PaginationData[T]:
-        base_statement = filter.filter(select(self._model))
-        count_statement = select(func.count()).select_from(base_statement.subquery())
+    async def _invalidate(self, item_ids: List):
+        if entity_cache.is_enabled(self._model):
+            await entity_cache.invalidate(self._model, item_ids)
 
-        result = await self._session.execute(count_statement)
-        total_count = result.one()[0]
+    async def list(
+        self,
+        page: PaginationInput,
+        filter: Filter,
+        count: CountStrategy | None = None,
+        etag: ETagContext | None = None,
+    ) -> PaginationData[T]:
+        """List items by page index.
+
+        Args:
+            count (CountStrategy): How `total_count` is produced, defaults to
+                `settings.pagination_count_strategy`
+            etag (ETagContext): Answer `If-None-Match` with 304 when the page is
+                unchanged, skipping serialization and transfer
+        """
+        count = CountStrategy(count or settings.pagination_count_strategy)
+        if self._coalesce:
+            key = self._flight_key(
+                "list", page.page_index, page.page_size, count, _filter_key(filter)
+            )
+            result = await single_flight.do(key, lambda: self._list(page, filter, count))
+            result = result.model_copy(
+                update={"detail": await self._attach(result.detail)}
+            )
+        else:
+            result = await self._list(page, filter, count)
+
+        if etag:
+            etag.check(
+                items_etag(
+                    self._model, result.detail, result.total_count, self._etag_fields
+                )
+            )
+        return self._respond(result, etag)
+
+    async def _list(
+        self, page: PaginationInput, filter: Filter, count: CountStrategy
+    ) -> PaginationData[T]:
+        base_statement = filter.filter(self._select())
 
         skip = (page.page_index - 1) * page.page_size
         limit = page.page_size
-        items = await self._session.execute(base_statement.offset(skip).limit(limit))
 
-        items = items.all()
-        items = [item[0] for item in items]
+        total_count = None
+        if count == CountStrategy.window:
+            statement = base_statement.add_columns(func.count().over())
+            rows = await self._session.execute(statement.offset(skip).limit(limit))
+            rows = rows.all()
+            items = [row[0] for row in rows]
+            if rows:
+                total_count = rows[0][-1]
+            else:
+                # Page is past the end, the window has nothing to report
+                count = CountStrategy.exact
+        else:
+            items = await self._session.execute(base_statement.offset(skip).limit(limit))
+            items = [item[0] for item in items.all()]
+
+        if count == CountStrategy.estimate:
+            total_count = await self._estimate_count(base_statement)
+            if total_count is None:
+                count = CountStrategy.exact
+        elif count == CountStrategy.cached:
+            total_count = await self._cached_count(base_statement)
+
+        if count == CountStrategy.exact:
+            total_count = await self._exact_count(base_statement)
+
         return PaginationData[T](
             detail=items,
             total_count=total_count,
-            total_page=math.ceil(total_count / page.page_size),
+            total_page=(
+                math.ceil(total_count / page.page_size)
+                if total_count is not None
+                else None
+            ),
             page_index=page.page_index,
             page_size=page.page_size,
             page_count=len(items),
+            count_strategy=count,
+        )
+
+    async def _exact_count(self, statement) -> int:
+        count_statement = select(func.count()).select_from(statement.subquery())
+        result = await self._session.execute(count_statement)
+        return result.one()[0]
+
+    async def _estimate_count(self, statement) -> int | None:
+        # Planner statistics only describe the whole table, so filtered lists
+        # and non-Postgres databases fall back to an exact count
+        if statement.whereclause is not None:
+            return None
+        if self._session.bind.dialect.name != "postgresql":
+            return None
+
+        result = await self._session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+            {"name": self._model.__table__.fullname},
+        )
+        estimate = result.scalar_one_or_none()
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if estimate is None or estimate < 0:
+            return None
+        return estimate
+
+    async def _cached_count(self, statement) -> int:
+        compiled = statement.compile(dialect=self._session.bind.dialect)
+        key = f"{compiled}|{compiled.params!r}"
+        now = time.monotonic()
+
+        cached = _count_cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        total_count = await self._exact_count(statement)
+        _count_cache.pop(key, None)
+        _count_cache[key] = (now + settings.pagination_count_cache_ttl, total_count)
+        while len(_count_cache) > settings.pagination_count_cache_size:
+            _count_cache.pop(next(iter(_count_cache)))
+        return total_count
+
+    async def cursor_list(
+        self,
+        page: CursorPaginationInput,
+        filter: Filter,
+        etag: ETagContext | None = None,
+    ) -> CursorPaginationData[T]:
+        """List items by keyset pagination.
+
+        Items are ordered by the filter's `order_by` (if any) followed by the
+        primary key, so the ordering is always unique. The next page is
+        selected with a `WHERE key > last_key` condition instead of OFFSET,
+        which lets the database seek through the index and keeps deep pages
+        as cheap as the first one.
+        """
+        if self._coalesce:
+            key = self._flight_key(
+                "cursor_list", page.cursor, page.page_size, _filter_key(filter)
+            )
+            result = await single_flight.do(key, lambda: self._cursor_list(page, filter))
+            result = result.model_copy(
+                update={"detail": await self._attach(result.detail)}
+            )
+        else:
+            result = await self._cursor_list(page, filter)
+
+        if etag:
+            etag.check(
+                items_etag(
+                    self._model, result.detail, result.next_cursor, self._etag_fields
+                )
+            )
+        return self._respond(result, etag)
+
+    async def _cursor_list(
+        self, page: CursorPaginationInput, filter: Filter
+    ) -> CursorPaginationData[T]:
+        keys = _cursor_keys(self._model, filter)
+        columns = [getattr(self._model, name) for name, _ in keys]
+
+        statement = filter.filter(self._select(*(name for name, _ in keys)))
+        if page.cursor:
+            values = _decode_cursor(page.cursor, [name for name, _ in keys])
+            try:
+                values = [
+                    TypeAdapter(column.type.python_type).validate_python(value)
+                    for column, value in zip(columns, values)
+                ]
+            except ValidationError:
+                raise BadRequestException(detail="Cursor is invalid.")
+            statement = statement.where(_cursor_condition(keys, columns, values))
+
+        order_by = [
+            column.desc() if desc else column.asc()
+            for column, (_, desc) in zip(columns, keys)
+        ]
+        statement = statement.order_by(*order_by).limit(page.page_size + 1)
+
+        items = await self._session.execute(statement)
+        items = [item[0] for item in items.all()]
+
+        has_more = len(items) > page.page_size
+        items = items[: page.page_size]
+        next_cursor = None
+        if has_more:
+            last = items[-1]
+            next_cursor = _encode_cursor(
+                [name for name, _ in keys], [getattr(last, name) for name, _ in keys]
+            )
+
+        return CursorPaginationData[T](
+            detail=items,
+            next_cursor=next_cursor,
+            has_more=has_more,
+            page_size=page.page_size,
+            page_count=len(items),
+        )
+
+    async def stream(self, filter: Filter, batch_size: int | None = None):
+        """Yield filtered items one by one from a server-side cursor.
+
+        Rows are fetched `batch_size` at a time (default
+        `settings.export_batch_size`), so memory stays flat regardless of how
+        many rows are exported.
+        """
+        statement = filter.filter(select(self._model)).execution_options(
+            yield_per=batch_size or settings.export_batch_size
         )
+        result = await self._session.stream_scalars(statement)
+        try:
+            async for item in result:
+                yield item
+        finally:
+            await result.close()
 
     async def list_all(self):
         items = await self._session.exec(self._model.select())
         return items.all()
 
     async def update(self, item_id, item_in: T):
+        if self._returning:
+            item = await self._update_returning(item_id, item_in)
+            await self._invalidate([item_id])
+            return item
+
         item = await self._session.get(self._model, item_id)
         if not item:
             raise NotFoundException()
@@ -58,13 +505,189 @@ class QueryService[T]:
         for field, value in item_data.items():
             setattr(item, field, value)
         await self._session.commit()
+        await self._invalidate([item_id])
         await self._session.refresh(item)
         return item
 
     async def delete(self, item_id) -> GeneralResponse:
+        if self._returning:
+            if (await self._delete_rows([item_id]))[0] is None:
+                raise NotFoundException()
+            await self._session.commit()
+            await self._invalidate([item_id])
+            return GeneralResponse(detail="Delete successfully.")
+
         item = await self._session.get(self._model, item_id)
         if not item:
             raise NotFoundException()
         await self._session.delete(item)
         await self._session.commit()
+        await self._invalidate([item_id])
         return GeneralResponse(detail="Delete successfully.")
+
+    async def _update_returning(self, item_id, item_in: T):
+        item_data = item_in.model_dump(exclude_unset=True)
+        if not item_data:
+            # Nothing to write, return the row like every other update path
+            item = await self._session.get(self._model, item_id)
+            if not item:
+                raise NotFoundException()
+            return item
+
+        statement = (
+            update(self._model)
+            .where(self._primary_key() == item_id)
+            .values(**item_data)
+            .returning(self._model)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        item = (await self._session.scalars(statement)).one_or_none()
+        if not item:
+            raise NotFoundException()
+        await self._session.commit()
+        return item
+
+    async def bulk_create(
+        self, items_in: List[T], chunk_size: int | None = None, atomic: bool = True
+    ) -> BulkResult[T]:
+        """Insert many items with one multi-row INSERT ... RETURNING per chunk.
+
+        Args:
+            chunk_size (int): Rows per statement, defaults to `settings.bulk_chunk_size`
+            atomic (bool): All-or-nothing when True, otherwise failed items are
+                reported per item and the rest are committed
+        """
+        # Build model instances first so Python-side defaults (e.g. uuid4) apply
+        rows = [self._model(**item_in.model_dump()).model_dump() for item_in in items_in]
+        return await self._run_bulk(rows, self._insert_rows, chunk_size, atomic)
+
+    async def bulk_update(
+        self,
+        items_in: List[BulkUpdateItem],
+        chunk_size: int | None = None,
+        atomic: bool = True,
+    ) -> BulkResult[T]:
+        """Update many items with one UPDATE ... FROM (VALUES ...) RETURNING per chunk."""
+        key = self._primary_key().key
+        rows = [
+            {key: item_in.id, **item_in.data.model_dump(exclude_unset=True)}
+            for item_in in items_in
+        ]
+        result = await self._run_bulk(rows, self._update_rows, chunk_size, atomic)
+        await self._invalidate([item_in.id for item_in in items_in])
+        return result
+
+    async def bulk_delete(
+        self, item_ids: List, chunk_size: int | None = None, atomic: bool = True
+    ) -> BulkResult:
+        """Delete many items with one DELETE ... RETURNING per chunk."""
+        result = await self._run_bulk(item_ids, self._delete_rows, chunk_size, atomic)
+        await self._invalidate(item_ids)
+        return result
+
+    def _primary_key(self):
+        return inspect(self._model).primary_key[0]
+
+    async def _run_bulk(self, rows: List, execute, chunk_size: int | None, atomic: bool):
+        chunk_size = chunk_size or settings.bulk_chunk_size
+        outcomes = []
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start : start + chunk_size]
+                if atomic:
+                    outcomes.extend((item, None) for item in await execute(chunk))
+                else:
+                    outcomes.extend(await self._execute_isolated(chunk, execute))
+
+            if atomic and any(item is None for item, _ in outcomes):
+                raise NotFoundException()
+            await self._session.commit()
+        except Exception:
+            await self._session.rollback()
+            raise
+
+        results = [
+            BulkItemResult(
+                index=index,
+                success=item is not None,
+                detail=item,
+                error=None if item is not None else (error or "Not found"),
+            )
+            for index, (item, error) in enumerate(outcomes)
+        ]
+        success_count = sum(1 for result in results if result.success)
+        return BulkResult(
+            detail=results,
+            success_count=success_count,
+            failure_count=len(results) - success_count,
+        )
+
+    async def _execute_isolated(self, chunk: List, execute) -> List:
+        try:
+            async with self._session.begin_nested():
+                return [(item, None) for item in await execute(chunk)]
+        except SQLAlchemyError:
+            pass
+
+        # The chunk failed as a whole, retry row by row to find the bad ones
+        outcomes = []
+        for row in chunk:
+            try:
+                async with self._session.begin_nested():
+                    outcomes.append(((await execute([row]))[0], None))
+            except SQLAlchemyError as e:
+                outcomes.append((None, str(getattr(e, "orig", None) or e)))
+        return outcomes
+
+    async def _insert_rows(self, rows: List[dict]) -> List:
+        statement = insert(self._model).returning(
+            self._model, sort_by_parameter_order=True
+        )
+        items = await self._session.scalars(statement, rows)
+        return items.all()
+
+    async def _update_rows(self, rows: List[dict]) -> List:
+        table = self._model.__table__
+        key = self._primary_key().key
+
+        # One statement per distinct set of updated columns
+        groups: dict[tuple, list[dict]] = {}
+        for row in rows:
+            fields = tuple(sorted(name for name in row if name != key))
+            groups.setdefault(fields, []).append(row)
+
+        updated = {}
+        for fields, group in groups.items():
+            ids = [row[key] for row in group]
+            if not fields:
+                statement = select(self._model).where(table.c[key].in_(ids))
+            else:
+                names = (key, *fields)
+                data = values(
+                    *[column(name, table.c[name].type) for name in names],
+                    name="bulk_data",
+                ).data([tuple(row[name] for name in names) for row in group])
+                statement = (
+                    update(self._model)
+                    .where(table.c[key] == data.c[key])
+                    .values({name: data.c[name] for name in fields})
+                    .returning(self._model)
+                    .execution_options(
+                        synchronize_session=False, populate_existing=True
+                    )
+                )
+            items = await self._session.scalars(statement)
+            updated.update({getattr(item, key): item for item in items.all()})
+
+        return [updated.get(row[key]) for row in rows]
+
+    async def _delete_rows(self, item_ids: List) -> List:
+        primary_key = self._primary_key()
+        statement = (
+            delete(self._model)
+            .where(primary_key.in_(item_ids))
+            .returning(primary_key)
+            .execution_options(synchronize_session=False)
+        )
+        deleted = set((await self._session.scalars(statement)).all())
+        return [item_id if item_id in deleted else None for item_id in item_ids]
@@ -0,0 +1,143 @@
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from pydantic_core import to_json
+from typing import Any, AsyncIterator
+import csv
+import functools
+import io
+import json
+
+from .schema import ExportFormat, PaginationData, CursorPaginationData
+
+# Flush to the client once this many bytes are buffered
+_EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by pydantic-core's Rust encoder.
+
+    Datetime, UUID, Enum and model values are encoded natively instead of going
+    through `jsonable_encoder`, and bytes that are already serialized (see
+    `trusted_response`) are sent as they are.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return to_json(content)
+
+
+def trusted_response(
+    content: Any,
+    schema: type[BaseModel],
+    headers: dict | None = None,
+    fields: tuple[str, ...] | None = None,
+) -> FastJSONResponse:
+    """Serialize rows loaded from the database through `schema` without validation.
+
+    FastAPI validates a returned ORM object against the route's response model
+    and then serializes the validated copy. Rows read from our own tables are
+    already valid, so this copies the schema's fields straight from the loaded
+    row state and encodes them once. Returning a Response skips FastAPI's
+    response model step, while the route's return annotation still documents
+    the schema.
+
+    Field aliases are honoured; field serializers and nested models of the
+    schema are not applied, so only use it with flat read schemas.
+
+    Args:
+        content: A single row, or PaginationData / CursorPaginationData of rows
+        schema (type[BaseModel]): Read schema of a row
+        fields (tuple[str, ...]): Only include these fields of `schema`
+    """
+    fields = _schema_fields(schema, fields)
+    if isinstance(content, (PaginationData, CursorPaginationData)):
+        data = {name: getattr(content, name) for name in type(content).model_fields}
+        data["detail"] = [_project(item, fields) for item in content.detail]
+    else:
+        data = _project(content, fields)
+    return FastJSONResponse(to_json(data), headers=headers)
+
+
+@functools.cache
+def _schema_fields(
+    schema: type[BaseModel], fields: tuple[str, ...] | None
+) -> tuple[tuple[str, str], ...]:
+    return tuple(
+        (name, field.serialization_alias or field.alias or name)
+        for name, field in schema.model_fields.items()
+        if fields is None or name in fields
+    )
+
+
+def _project(item, fields: tuple[tuple[str, str], ...]) -> dict:
+    # Loaded columns sit in the instance __dict__; reading them there avoids
+    # the ORM attribute descriptors, which dominate the cost on large pages
+    state = item.__dict__
+    return {
+        key: state[name] if name in state else getattr(item, name)
+        for name, key in fields
+    }
+
+
+def export_response(
+    items: AsyncIterator,
+    schema: type[BaseModel],
+    format: ExportFormat = ExportFormat.ndjson,
+    filename: str = "export",
+) -> StreamingResponse:
+    """Stream items as NDJSON or CSV while they are read from the database.
+
+    Args:
+        items (AsyncIterator): Rows, usually from `QueryService.stream`
+        schema (type[BaseModel]): Read schema each row is serialized with
+        format (ExportFormat): Output format
+        filename (str): Download file name without extension
+    """
+    if format == ExportFormat.csv:
+        content = _iter_csv(items, schema)
+        media_type = "text/csv"
+    else:
+        content = _iter_ndjson(items, schema)
+        media_type = "application/x-ndjson"
+
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}.{format.value}"'
+        },
+    )
+
+
+async def _iter_ndjson(items: AsyncIterator, schema: type[BaseModel]):
+    buffer = io.StringIO()
+    async for item in items:
+        buffer.write(schema.model_validate(item).model_dump_json())
+        buffer.write("\n")
+        if buffer.tell() >= _EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def _iter_csv(items: AsyncIterator, schema: type[BaseModel]):
+    fields = list(schema.model_fields.keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    async for item in items:
+        row = schema.model_validate(item).model_dump(mode="json")
+        writer.writerow([_csv_value(row.get(field)) for field in fields])
+        if buffer.tell() >= _EXPORT_BUFFER_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
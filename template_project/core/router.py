@@ -1,27 +1,76 @@
 import importlib
+import json
 from pathlib import Path
 from fastapi import FastAPI, APIRouter
 
 from .logger import logger
 from .settings import settings
+from .startup import startup_timer
 
+source_path = Path(__file__).parent.parent
 
-def setup_router(app: FastAPI):
-    source_path = Path(__file__).parent.parent
 
+def setup_router(app: FastAPI):
     logger.info("Starting to load routers...")
 
-    for module_dir in source_path.iterdir():
+    routers = _read_manifest()
+    if routers is None:
+        routers = discover_routers()
+    else:
+        logger.info(f"Loading {len(routers)} routers from {settings.route_manifest}")
+
+    for module_name, router_name in routers:
+        with startup_timer.phase(f"routers/{module_name}"):
+            _load_router(app, module_name, router_name)
+
+    logger.info("All routers loaded successfully.")
+
+
+def discover_routers() -> list[tuple[str, str]]:
+    """Scan module directories for `api.router` and `auth.auth_router`."""
+    routers = []
+    for module_dir in sorted(source_path.iterdir()):
         if module_dir.is_dir() and module_dir.name not in ["__pycache__", "core"]:
             router_file = module_dir / "api.py"
             if router_file.exists():
-                _load_router(app, f"{module_dir.name}.api", "router")
+                routers.append((f"{module_dir.name}.api", "router"))
 
             auth_file = module_dir / "auth.py"
             if auth_file.exists():
-                _load_router(app, f"{module_dir.name}.auth", "auth_router")
+                routers.append((f"{module_dir.name}.auth", "auth_router"))
+    return routers
 
-    logger.info("All routers loaded successfully.")
+
+def write_route_manifest() -> Path:
+    """Save the discovered routers so workers can skip the directory scan."""
+    manifest_path = source_path / settings.route_manifest
+    routers = discover_routers()
+    manifest_path.write_text(
+        json.dumps({"routers": routers}, indent=2), encoding="utf-8"
+    )
+    return manifest_path
+
+
+def _read_manifest() -> list[tuple[str, str]] | None:
+    # Debug mode always scans, so new modules show up without regenerating
+    if settings.debug_mode:
+        return None
+    return read_route_manifest()
+
+
+def read_route_manifest() -> list[tuple[str, str]] | None:
+    """Routers saved by `python main.py routes`, None without a valid manifest."""
+    if not settings.route_manifest:
+        return None
+    manifest_path = source_path / settings.route_manifest
+    if not manifest_path.exists():
+        return None
+    try:
+        data = json.loads(manifest_path.read_text(encoding="utf-8"))
+        return [(module, router) for module, router in data["routers"]]
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error(f"Invalid route manifest {manifest_path}, scanning instead: {e}")
+        return None
 
 
 def _load_router(app: FastAPI, module_name: str, router_name: str):
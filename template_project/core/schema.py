@@ -2,6 +2,7 @@ from pydantic import BaseModel, create_model
 from pydantic.fields import FieldInfo
 from sqlmodel import SQLModel
 from typing import List, TypeVar, Generic, Optional, Any
+from enum import Enum
 
 
 class GeneralResponse(BaseModel):
@@ -11,13 +12,22 @@ class GeneralResponse(BaseModel):
 T = TypeVar("T")
 
 
+class CountStrategy(str, Enum):
+    exact = "exact"  # separate SELECT count(*) over the filtered query
+    window = "window"  # count(*) OVER () in the page query, one round trip
+    estimate = "estimate"  # planner row estimate, unfiltered lists only
+    cached = "cached"  # exact count cached per filter for a short TTL
+    none = "none"  # no total count
+
+
 class PaginationData(BaseModel, Generic[T]):
     detail: List[T]
-    total_count: int
-    total_page: int
+    total_count: Optional[int]
+    total_page: Optional[int]
     page_index: int
     page_size: int
     page_count: int
+    count_strategy: CountStrategy = CountStrategy.exact
 
     model_config = {
         "json_schema_extra": {
@@ -28,16 +38,68 @@ class PaginationData(BaseModel, Generic[T]):
                 "page_index": 1,
                 "page_size": 20,
                 "page_count": 0,
+                "count_strategy": "exact",
             }
         }
     }
 
 
+class BulkItemResult(BaseModel, Generic[T]):
+    index: int
+    success: bool
+    detail: Optional[T] = None
+    error: Optional[str] = None
+
+
+class BulkResult(BaseModel, Generic[T]):
+    detail: List[BulkItemResult[T]]
+    success_count: int
+    failure_count: int
+
+
+K = TypeVar("K")
+
+
+class BulkUpdateItem(BaseModel, Generic[K, T]):
+    id: K
+    data: T
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
 class PaginationInput(BaseModel):
     page_index: int
     page_size: int
 
 
+class CursorPaginationData(BaseModel, Generic[T]):
+    detail: List[T]
+    next_cursor: Optional[str]
+    has_more: bool
+    page_size: int
+    page_count: int
+
+    model_config = {
+        "json_schema_extra": {
+            "example": {
+                "detail": [],
+                "next_cursor": None,
+                "has_more": False,
+                "page_size": 20,
+                "page_count": 0,
+            }
+        }
+    }
+
+
+class CursorPaginationInput(BaseModel):
+    cursor: Optional[str] = None
+    page_size: int
+
+
 def make_partial_model(
     module_name: str, model: type[SQLModel], exclude_fields: list[str] = None
 ) -> type[BaseModel]:
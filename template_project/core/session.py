@@ -1,18 +1,140 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel import create_engine, Session
-from typing import AsyncGenerator
+from contextlib import contextmanager
+from typing import AsyncGenerator, Iterator
+import atexit
+import os
+import time
 from .settings import settings
 
 
-engine = create_async_engine(str(settings.database_uri), echo=settings.debug_mode)
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeout_count = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            self.timeout_count += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.wait_count += 1
+            self.wait_time_total += elapsed
+            self.wait_time_max = max(self.wait_time_max, elapsed)
+
+
+def _connect_args() -> dict:
+    # psycopg prepares a statement server-side after it ran this many times,
+    # None disables preparing (required behind pgbouncer transaction pooling)
+    return {"prepare_threshold": settings.db_prepare_threshold}
+
+
+engine = create_async_engine(
+    str(settings.database_uri),
+    echo=settings.db_echo,
+    poolclass=InstrumentedPool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    connect_args=_connect_args(),
+)
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+_sync_engine: Engine | None = None
+
+
+def _reset_pools_after_fork():
+    # A forked worker must not use (or close) connections opened by its
+    # parent; dispose(close=False) leaves those alone and starts empty pools
+    engine.sync_engine.dispose(close=False)
+    if _sync_engine is not None:
+        _sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+def pool_status() -> dict:
+    """Snapshot of the async engine pool, for metrics endpoints or log lines."""
+    pool: InstrumentedPool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.db_max_overflow,
+        "wait_count": pool.wait_count,
+        "wait_time_total": pool.wait_time_total,
+        "wait_time_avg": pool.wait_time_total / pool.wait_count if pool.wait_count else 0.0,
+        "wait_time_max": pool.wait_time_max,
+        "timeout_count": pool.timeout_count,
+    }
+
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session() as session:
         yield session
 
 
+def get_sync_engine() -> Engine:
+    """Process-wide sync engine for CLI commands and batch jobs, created on first use."""
+    global _sync_engine
+    if _sync_engine is None:
+        _sync_engine = create_engine(
+            str(settings.database_uri),
+            echo=settings.db_echo,
+            pool_size=settings.db_sync_pool_size,
+            max_overflow=settings.db_sync_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=True,
+            connect_args=_connect_args(),
+        )
+        atexit.register(dispose_sync_engine)
+    return _sync_engine
+
+
+def dispose_sync_engine():
+    global _sync_engine
+    if _sync_engine is not None:
+        _sync_engine.dispose()
+        _sync_engine = None
+
+
 def get_session_sync(echo: bool = False) -> Session:
-    engine = create_engine(str(settings.database_uri), echo=echo)
+    engine = get_sync_engine()
+    if echo:
+        # A copy sharing the pool, so only this session logs its SQL
+        engine = engine.execution_options()
+        engine.echo = True
     return Session(engine)
+
+
+@contextmanager
+def sync_session_scope() -> Iterator[Session]:
+    """Run one short transaction on the cached sync engine.
+
+    Commits when the block exits normally and rolls back on error, e.g.
+
+        for chunk in chunks:
+            with sync_session_scope() as session:
+                session.add_all(chunk)
+    """
+    with Session(get_sync_engine()) as session:
+        with session.begin():
+            yield session
@@ -22,10 +22,34 @@ class Settings(BaseSettings):
     swagger_login_uri: str = "/swagger-login"
     access_token_expire_minutes: int = 30
     refresh_token_expire_minutes: int = 60
+    token_cache_size: int = 10000
+    token_revocation_refresh_seconds: int = 5
+    token_revocation_prune_seconds: int = 3600
+    # Row ids are taken at insert, not at commit: each refresh re-reads this
+    # many ids below the highest one seen, so rows committed out of order
+    # are not skipped, and everything is re-read every reload interval
+    token_revocation_lookback_ids: int = 1000
+    token_revocation_reload_seconds: int = 600
+    password_hash_executor: str = "thread"  # "thread" or "process"
+    password_hash_workers: int = 4
 
     # Documents
     docs_url: str = "/docs"
     redoc_url: str = "/redocs"
+    openapi_url: str = "/openapi.json"
+    # "generate": built by FastAPI on first request, "file": served from
+    # openapi_file (written by `python main.py openapi`), "disabled": no docs
+    openapi_mode: str = "generate"
+    openapi_file: str = "openapi.json"
+
+    # Production server (`python main.py serve --prod`)
+    serve_workers: int = 0  # 0: one per CPU
+    serve_backlog: int = 2048
+    serve_keep_alive: int = 5
+    serve_graceful_timeout: int = 30
+    serve_max_requests: int = 0  # recycle a worker after this many requests, 0: never
+    serve_max_requests_jitter: int = 0  # so workers do not all recycle at once
+    serve_access_log: bool = False
 
     # Database
     db_host: str = "${db-host}"
@@ -34,6 +58,17 @@ class Settings(BaseSettings):
     db_password: str = "${db-password}"
     db_name: str = "${db-name}"
 
+    # Database connection pool
+    db_echo: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 10
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = False
+    db_prepare_threshold: int | None = 5
+    db_sync_pool_size: int = 2
+    db_sync_max_overflow: int = 0
+
     @computed_field
     @property
     def database_uri(self) -> MultiHostUrl:
@@ -51,17 +86,83 @@ class Settings(BaseSettings):
             path=self.db_name,
         )
 
+    # Pagination
+    pagination_count_strategy: str = "exact"
+    pagination_count_cache_ttl: int = 10
+    pagination_count_cache_size: int = 1024
+
+    # Query
+    # Opt-in, endpoints can also pass QueryService(..., returning=True)
+    query_returning_writes: bool = False
+    query_coalesce_reads: bool = False
+    bulk_chunk_size: int = 500
+    export_batch_size: int = 1000
+
+    # Entity cache
+    cache_backend: str = ""  # "", "memory" or "redis"
+    cache_redis_url: str = "redis://localhost:6379/0"
+    cache_ttl: int = 60
+    # Writes only invalidate the worker that made them, so every worker's own
+    # copy is kept at most this long; without a shared backend this is the
+    # effective TTL, i.e. how long another worker may serve a stale row
+    cache_local_ttl: int = 5
+    cache_local_size: int = 10000
+
+    # Background tasks
+    # "memory": on the event loop of each server worker, "process": on a
+    # process pool per server worker, "queue": sent to `python main.py worker`,
+    # "database": stored in Postgres and run by `python main.py worker` on
+    # any host
+    task_backend: str = "memory"
+    task_workers: int = 0  # pool processes, also tasks running at once, 0: one per CPU
+    task_queue_size: int = 1000
+    task_queue_timeout: float = 5  # seconds kiq() waits on a full queue, then 503
+    task_queue_host: str = "127.0.0.1"
+    task_queue_port: int = 9100
+    task_queue_connections: int = 4  # per server worker, kiq() calls sent at once
+    task_shutdown_timeout: int = 30  # seconds to finish queued tasks when stopping
+    task_claim_batch: int = 10  # tasks a "database" worker claims per query
+    task_poll_seconds: float = 5  # fallback to LISTEN/NOTIFY, picks up retries
+    task_visibility_timeout: int = 60  # seconds before a claimed task can run again
+    task_max_attempts: int = 3
+    task_retry_delay: float = 1  # seconds, doubled after every failed attempt
+    task_result_ttl: int = 86400  # seconds finished tasks are kept
+    task_batch_size: int = 100  # payloads per call of a batch task
+    task_batch_wait: float = 1  # seconds a partial batch waits for more payloads
+    task_result_cache_ttl: int = 60
+    task_result_cache_size: int = 1000
+    # Shared store of cached task results, apart from the entity cache
+    task_result_cache_backend: str = ""  # "", "memory" or "redis"
+    task_result_cache_redis_url: str = "redis://localhost:6379/0"
+
     # CORS
     cors_allow_origins: list = ["*"]
     cors_allow_credentials: bool = True
     cors_allow_methods: list = ["*"]
     cors_allow_headers: list = ["*"]
 
-    # GZip
-    gzip_minimum_size: int = 2000
-    gzip_compress_level: int = 9
+    # Compression
+    compression_encodings: list = ["zstd", "br", "gzip"]  # server preference order
+    compression_minimum_size: int = 2000
+    compression_thread_minimum_size: int = 128 * 1024
+    compression_zstd_level: int = 3
+    compression_brotli_level: int = 4
+    compression_gzip_level: int = 6
+
+    # Metrics
+    metrics_url: str = "/metrics"  # Prometheus endpoint, "" disables metrics
+    metrics_server_timing: bool = False  # add a Server-Timing header to responses
+    # Latency histogram buckets in seconds
+    metrics_buckets: list = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+    # Where `serve --prod` workers share their metrics, so a scrape reaching
+    # any worker reports all of them; "": a temporary directory per run
+    metrics_dir: str = ""
+    metrics_flush_seconds: float = 2
 
     external_schema_path: str = ""
+    # Written by `python main.py routes`, used instead of scanning modules
+    # when debug_mode is off
+    route_manifest: str = "route_manifest.json"
 
 
 settings = Settings()
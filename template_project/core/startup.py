@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+import time
+
+from .logger import logger
+
+
+class StartupTimer:
+    """Wall time of each application startup phase, reported once started."""
+
+    def __init__(self):
+        self._phases: dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def status(self) -> dict:
+        phases = {
+            name: round(seconds * 1000, 3) for name, seconds in self._phases.items()
+        }
+        # Nested phases ("routers/user.api") are already part of their parent
+        total = sum(ms for name, ms in phases.items() if "/" not in name)
+        return {"phases_ms": phases, "total_ms": round(total, 3)}
+
+    def log(self):
+        status = self.status()
+        phases = ", ".join(
+            f"{name} {ms:.1f}ms" for name, ms in status["phases_ms"].items()
+        )
+        logger.info(f"Startup took {status['total_ms']:.1f}ms: {phases}")
+
+
+startup_timer = StartupTimer()
@@ -1,4 +1,321 @@
-from taskiq import InMemoryBroker
+from pydantic_core import from_json, to_json
+import asyncio
 
+from .settings import settings
+from .logger import logger
+from .cache import LRUCache, create_backend
+from .singleflight import SingleFlight
 
-task_broker = InMemoryBroker()
+
+class TaskStats:
+    """Queue depth and latency of tasks run by the process and queue brokers."""
+
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self._stats = {
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+            "run_total": 0.0,
+            "run_max": 0.0,
+        }
+
+    def reject(self):
+        self._stats["rejected"] += 1
+
+    def record(self, wait: float, run: float, failed: bool):
+        stats = self._stats
+        stats["failed" if failed else "completed"] += 1
+        stats["wait_total"] += wait
+        stats["wait_max"] = max(stats["wait_max"], wait)
+        stats["run_total"] += run
+        stats["run_max"] = max(stats["run_max"], run)
+
+    def status(self) -> dict:
+        stats = self._stats
+        count = stats["completed"] + stats["failed"]
+        return {
+            "backend": settings.task_backend,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": stats["completed"],
+            "failed": stats["failed"],
+            "rejected": stats["rejected"],
+            "wait_avg_ms": round(stats["wait_total"] / count * 1000, 3)
+            if count
+            else 0.0,
+            "wait_max_ms": round(stats["wait_max"] * 1000, 3),
+            "run_avg_ms": round(stats["run_total"] / count * 1000, 3)
+            if count
+            else 0.0,
+            "run_max_ms": round(stats["run_max"] * 1000, 3),
+        }
+
+
+task_stats = TaskStats()
+
+
+class _Pending:
+    """A submission held back in a debounce window or a batch buffer."""
+
+    def __init__(self, task, args: tuple, kwargs: dict):
+        self.task = task
+        self.args = args
+        self.kwargs = kwargs
+        self.payloads: list = []
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class TaskCoalescer:
+    """Collapses repeated task submissions before they cost a full run.
+
+    - `kiq_unique` gives a task a dedup key. While a task with that key is
+      still queued, the process/queue/database brokers drop duplicates; the
+      memory broker, which has no queue, drops them while it is running.
+      With `debounce`, calls within the window are sent once, with the
+      arguments of the last call.
+    - `batch` buffers payloads and calls the task once with the list, after
+      `task_batch_size` payloads or `task_batch_wait` seconds.
+    - `cached` returns the result of an earlier run with the same key while
+      it is younger than the TTL; concurrent callers share one run.
+    """
+
+    def __init__(self):
+        self._debounced: dict[str, _Pending] = {}
+        self._batches: dict[str, _Pending] = {}
+        self._results = LRUCache(
+            settings.task_result_cache_size, settings.task_result_cache_ttl
+        )
+        self._backend = create_backend(
+            settings.task_result_cache_backend, settings.task_result_cache_redis_url
+        )
+        self._flights = SingleFlight()
+        self._flushes: set[asyncio.Task] = set()
+        self._stats = {
+            "deduplicated": 0,
+            "debounced": 0,
+            "batches": 0,
+            "batched": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+        }
+
+    def record(self, counter: str):
+        self._stats[counter] += 1
+
+    async def kiq_unique(self, task, *args, key: str, debounce: float = 0, **kwargs):
+        """Send `task` unless an identical one is pending.
+
+        Returns the taskiq handle, or None when the call was debounced. A
+        duplicate dropped by the broker still gets a handle, but its result
+        is never set; use `cached` to wait for a shared result.
+        """
+        key = f"{task.task_name}:{key}"
+        if not debounce:
+            return await task.kicker().with_labels(dedup_key=key).kiq(*args, **kwargs)
+
+        pending = self._debounced.get(key)
+        if pending is not None:
+            pending.args, pending.kwargs = args, kwargs
+            self.record("debounced")
+            return None
+        pending = self._debounced[key] = _Pending(task, args, kwargs)
+        pending.timer = asyncio.get_running_loop().call_later(
+            debounce, self._spawn, self._send_debounced, key
+        )
+        return None
+
+    async def batch(
+        self,
+        task,
+        payload,
+        max_size: int | None = None,
+        max_wait: float | None = None,
+    ):
+        """Buffer `payload`, `task` is called with a list of payloads."""
+        pending = self._batches.get(task.task_name)
+        if pending is None:
+            pending = self._batches[task.task_name] = _Pending(task, (), {})
+            pending.timer = asyncio.get_running_loop().call_later(
+                max_wait or settings.task_batch_wait,
+                self._spawn,
+                self._send_batch,
+                task.task_name,
+            )
+        pending.payloads.append(payload)
+        if len(pending.payloads) >= (max_size or settings.task_batch_size):
+            await self._send_batch(task.task_name)
+
+    async def cached(
+        self,
+        task,
+        *args,
+        key: str,
+        ttl: int | None = None,
+        timeout: float = -1,
+        **kwargs,
+    ):
+        """Result of `task` for `key`, run and waited for on a cache miss.
+
+        Needs a broker with results, not "queue". Failed runs are not cached.
+        With `task_result_cache_backend` set, server workers share results.
+        """
+        ttl = ttl or settings.task_result_cache_ttl
+        key = f"task:{task.task_name}:{key}"
+        entry = self._results.get(key)
+        if entry is None and self._backend is not None:
+            data = await self._backend.get(key)
+            if data is not None:
+                entry = from_json(data)
+                self._results.set(key, entry, ttl)
+        if entry is not None:
+            self.record("cache_hits")
+            return entry["value"]
+
+        async def run():
+            self.record("cache_misses")
+            handle = await task.kiq(*args, **kwargs)
+            result = await handle.wait_result(timeout=timeout)
+            entry = {"value": result.raise_for_error().return_value}
+            self._results.set(key, entry, ttl)
+            if self._backend is not None:
+                await self._backend.set(key, to_json(entry), ttl)
+            return entry["value"]
+
+        return await self._flights.do(key, run)
+
+    async def flush(self):
+        """Send everything still held back, before the broker shuts down."""
+        for key in list(self._debounced):
+            await self._send_debounced(key)
+        for name in list(self._batches):
+            await self._send_batch(name)
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def status(self) -> dict:
+        return {
+            **self._stats,
+            "pending_debounced": len(self._debounced),
+            "pending_batched": sum(len(p.payloads) for p in self._batches.values()),
+            "shared_results": self._flights.coalesced,
+        }
+
+    def _spawn(self, send, key: str):
+        flush = asyncio.ensure_future(send(key))
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flush_done)
+
+    def _flush_done(self, flush: asyncio.Task):
+        self._flushes.discard(flush)
+        if not flush.cancelled() and flush.exception() is not None:
+            logger.error(f"Failed to send coalesced task: {flush.exception()!r}")
+
+    async def _send_debounced(self, key: str):
+        pending = self._debounced.pop(key, None)
+        if pending is None:
+            return
+        pending.timer.cancel()
+        await pending.task.kicker().with_labels(dedup_key=key).kiq(
+            *pending.args, **pending.kwargs
+        )
+
+    async def _send_batch(self, name: str):
+        pending = self._batches.pop(name, None)
+        if pending is None:
+            return
+        pending.timer.cancel()
+        self._stats["batches"] += 1
+        self._stats["batched"] += len(pending.payloads)
+        await pending.task.kiq(pending.payloads)
+
+
+task_coalescer = TaskCoalescer()
+
+
+def task_status() -> dict:
+    return {**task_stats.status(), "coalesced": task_coalescer.status()}
+
+
+class LazyBroker:
+    """Task broker that is only created when a module first uses it.
+
+    Importing taskiq pulls in aiohttp and adds about 0.3s to every worker's
+    boot, so projects without background tasks never pay for it.
+
+    `settings.task_backend` picks the broker:
+    "memory" runs tasks on the event loop of the web worker,
+    "process" runs them on a local process pool (see `core.broker`),
+    "queue" sends them to `python main.py worker`,
+    "database" queues them in Postgres for workers on any host.
+    """
+
+    def __init__(self):
+        self._broker = None
+
+    @property
+    def broker(self):
+        if self._broker is None:
+            if settings.task_backend == "process":
+                from .broker import ProcessPoolBroker
+
+                self._broker = ProcessPoolBroker()
+            elif settings.task_backend == "queue":
+                from .broker import LocalQueueBroker
+
+                self._broker = LocalQueueBroker()
+            elif settings.task_backend == "database":
+                from .broker import DatabaseBroker
+
+                self._broker = DatabaseBroker()
+            else:
+                from .broker import MemoryBroker
+
+                self._broker = MemoryBroker()
+        return self._broker
+
+    def setup_error_handler(self, app):
+        """Answer with the HTTP error behind a task that could not be queued.
+
+        taskiq wraps errors from `kick` in `SendTaskError`, so a full queue
+        would otherwise be a 500 instead of a 503.
+        """
+        if self._broker is None:
+            return
+
+        from fastapi.exception_handlers import http_exception_handler
+        from starlette.exceptions import HTTPException
+        from taskiq.exceptions import SendTaskError
+
+        async def send_task_error(request, exc: SendTaskError):
+            if isinstance(exc.__cause__, HTTPException):
+                return await http_exception_handler(request, exc.__cause__)
+            # Raising here would be reported as a failure of the handler itself
+            logger.error(f"Failed to send task: {exc.__cause__ or exc!r}")
+            return await http_exception_handler(
+                request, HTTPException(500, "Failed to send task")
+            )
+
+        app.add_exception_handler(SendTaskError, send_task_error)
+
+    async def startup(self):
+        # Task modules are imported with the routers, before the lifespan runs
+        if self._broker is not None:
+            await self._broker.startup()
+
+    async def shutdown(self):
+        if self._broker is not None:
+            await task_coalescer.flush()
+            # InMemoryBroker closes its executor on shutdown, let the tasks
+            # it started (flushed ones included) finish first
+            if hasattr(self._broker, "wait_all"):
+                await self._broker.wait_all()
+            await self._broker.shutdown()
+
+    def __getattr__(self, name: str):
+        return getattr(self.broker, name)
+
+
+task_broker = LazyBroker()
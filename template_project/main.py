@@ -1,6 +1,10 @@
+import time
+
+_boot = time.perf_counter()
+
 from fastapi import FastAPI
+from fastapi.datastructures import Default
 from contextlib import asynccontextmanager
-import typer
 
 from core import (
     settings,
@@ -8,10 +12,18 @@ from core import (
     setup_logger,
     setup_middleware,
     setup_router,
+    setup_metrics,
     task_broker,
+    FastJSONResponse,
 )
+from core.startup import startup_timer
+from core.metrics import shared_metrics
+from core.openapi import openapi_options, setup_openapi
 from core.tools import append_to_environment
-from command import command
+from authentication.tool import shutdown_hash_executor
+from authentication.revocation import revocation_list
+
+startup_timer.record("imports", time.perf_counter() - _boot)
 
 setup_logger()
 append_to_environment(settings.external_schema_path)
@@ -20,10 +32,17 @@ append_to_environment(settings.external_schema_path)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Application startup...")
-    await task_broker.startup()
+    with startup_timer.phase("lifespan"):
+        await task_broker.startup()
+        await revocation_list.start()
+        await shared_metrics.start()
+    startup_timer.log()
     yield
     logger.info("Application shutdown...")
+    await shared_metrics.stop()
+    await revocation_list.stop()
     await task_broker.shutdown()
+    await shutdown_hash_executor()
 
 
 app = FastAPI(
@@ -31,12 +50,24 @@ app = FastAPI(
     description=settings.app_description,
     lifespan=lifespan,
     debug=settings.debug_mode,
-    docs_url=settings.docs_url,
-    redoc_url=settings.redoc_url,
+    **openapi_options(),
+    # Wrapped in Default so routes with a response model keep FastAPI's own
+    # direct-to-bytes serialization, the rest are encoded by pydantic-core
+    default_response_class=Default(FastJSONResponse),
 )
-setup_middleware(app)
-setup_router(app)
+with startup_timer.phase("middleware"):
+    setup_middleware(app)
+with startup_timer.phase("routers"):
+    setup_router(app)
+task_broker.setup_error_handler(app)
+with startup_timer.phase("openapi"):
+    setup_openapi(app)
+# Added last so it is the outermost middleware and times everything
+setup_metrics(app)
 
 
 if __name__ == "__main__":
+    # The CLI is only needed when run as a script, not in server workers
+    from command import command
+
     command()
@@ -0,0 +1,26 @@
+import pytest
+
+from core.compression import negotiate_encoding
+
+ENCODINGS = ["zstd", "br", "gzip"]
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip", "gzip"),
+        ("gzip, br", "br"),  # ties go to the server order
+        ("GZIP, BR;q=0.5", "gzip"),
+        ("br;q=0.2, gzip;q=0.8", "gzip"),
+        ("*", "zstd"),
+        ("*;q=0.1, gzip;q=0.5", "gzip"),
+        ("gzip;q=0, br;q=0", None),
+        ("*, zstd;q=0", "br"),
+        ("identity", None),
+        ("", None),
+        ("gzip;q=oops, br", "br"),
+        (" , ;q=1, br ; q=0.9", "br"),
+    ],
+)
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding, ENCODINGS) == expected
@@ -0,0 +1,360 @@
+from typing import Optional
+import asyncio
+import json
+
+from fastapi import Response
+from fastapi_filter.contrib.sqlalchemy import Filter
+from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import Field, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.requests import Request
+import pytest
+
+from core import query
+from core.etag import ETagContext
+from core.exception import BadRequestException, NotFoundException, NotModifiedException
+from core.query import QueryService, _decode_cursor, _encode_cursor
+from core.schema import (
+    BulkUpdateItem,
+    CountStrategy,
+    CursorPaginationInput,
+    PaginationInput,
+)
+
+
+class Widget(SQLModel, table=True):
+    __tablename__ = "test_widget"
+
+    id: int = Field(primary_key=True)
+    name: str
+    rank: int
+    version: int = 1
+
+
+class WidgetCreate(SQLModel):
+    id: int
+    name: str
+    rank: int
+
+
+class WidgetUpdate(SQLModel):
+    name: Optional[str] = None
+    rank: Optional[int] = None
+
+
+class WidgetRead(BaseModel):
+    id: int
+    name: str
+    rank: int
+
+
+class WidgetFilter(Filter):
+    name: Optional[str] = None
+    order_by: Optional[list[str]] = None
+
+    class Constants(Filter.Constants):
+        model = Widget
+
+
+# (id, name, rank), ranks repeat so orderings need the primary key tiebreak
+WIDGETS = [(id, f"widget{id}", id % 3) for id in range(1, 8)]
+
+
+def run(check):
+    async def main():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(
+                SQLModel.metadata.create_all, tables=[Widget.__table__]
+            )
+        session_maker = async_sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False
+        )
+        async with session_maker() as session:
+            session.add_all(
+                Widget(id=id, name=name, rank=rank) for id, name, rank in WIDGETS
+            )
+            await session.commit()
+        try:
+            async with session_maker() as session:
+                await check(session)
+        finally:
+            await engine.dispose()
+
+    asyncio.run(main())
+
+
+def etag_context(if_none_match: str = "") -> tuple[ETagContext, Response]:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    request = Request({"type": "http", "headers": headers})
+    response = Response()
+    return ETagContext(request, response), response
+
+
+def test_cursor_round_trip():
+    cursor = _encode_cursor(["rank", "id"], [2, 5])
+    assert "=" not in cursor
+    assert _decode_cursor(cursor, ["rank", "id"]) == [2, 5]
+
+
+def test_cursor_rejects_other_ordering_and_garbage():
+    cursor = _encode_cursor(["rank", "id"], [2, 5])
+    with pytest.raises(BadRequestException):
+        _decode_cursor(cursor, ["id"])
+    with pytest.raises(BadRequestException):
+        _decode_cursor("not a cursor!", ["id"])
+
+
+@pytest.mark.parametrize(
+    "order_by, key",
+    [
+        (None, lambda row: row[0]),
+        (["rank"], lambda row: (row[2], row[0])),
+        (["-rank"], lambda row: (-row[2], row[0])),
+        (["-rank", "-id"], lambda row: (-row[2], -row[0])),
+    ],
+)
+def test_cursor_list_walks_every_row_once(order_by, key):
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        filter = WidgetFilter(order_by=order_by)
+        ids, cursor = [], None
+        while True:
+            page = await service.cursor_list(
+                CursorPaginationInput(cursor=cursor, page_size=3), filter
+            )
+            ids.extend(item.id for item in page.detail)
+            if not page.has_more:
+                break
+            cursor = page.next_cursor
+        assert ids == [row[0] for row in sorted(WIDGETS, key=key)]
+
+    run(check)
+
+
+def test_cursor_list_rejects_cursor_of_other_ordering():
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        page = await service.cursor_list(
+            CursorPaginationInput(page_size=2), WidgetFilter(order_by=["rank"])
+        )
+        with pytest.raises(BadRequestException):
+            await service.cursor_list(
+                CursorPaginationInput(cursor=page.next_cursor, page_size=2),
+                WidgetFilter(),
+            )
+
+    run(check)
+
+
+@pytest.mark.parametrize(
+    "count, total, reported",
+    [
+        (CountStrategy.exact, 7, CountStrategy.exact),
+        (CountStrategy.window, 7, CountStrategy.window),
+        # Only Postgres has planner estimates
+        (CountStrategy.estimate, 7, CountStrategy.exact),
+        (CountStrategy.cached, 7, CountStrategy.cached),
+        (CountStrategy.none, None, CountStrategy.none),
+    ],
+)
+def test_list_count_strategies(count, total, reported):
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        page = await service.list(
+            PaginationInput(page_index=1, page_size=3), WidgetFilter(), count
+        )
+        assert [item.id for item in page.detail] == [1, 2, 3]
+        assert page.total_count == total
+        assert page.total_page == (3 if total else None)
+        assert page.count_strategy == reported
+
+    run(check)
+
+
+def test_list_window_count_past_the_end_falls_back_to_exact():
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        page = await service.list(
+            PaginationInput(page_index=5, page_size=3),
+            WidgetFilter(),
+            CountStrategy.window,
+        )
+        assert page.detail == []
+        assert page.total_count == 7
+        assert page.count_strategy == CountStrategy.exact
+
+    run(check)
+
+
+def test_list_cached_count_is_reused_per_filter(monkeypatch):
+    monkeypatch.setattr(query, "_count_cache", {})
+
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        page = PaginationInput(page_index=1, page_size=3)
+        await service.list(page, WidgetFilter(), CountStrategy.cached)
+        await service.create(WidgetCreate(id=8, name="widget8", rank=2))
+
+        cached = await service.list(page, WidgetFilter(), CountStrategy.cached)
+        assert cached.total_count == 7
+        filtered = await service.list(
+            page, WidgetFilter(name="widget8"), CountStrategy.cached
+        )
+        assert filtered.total_count == 1
+
+    run(check)
+
+
+def test_bulk_create_atomic_rolls_back_every_chunk():
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        items = [
+            WidgetCreate(id=10, name="new", rank=0),
+            WidgetCreate(id=1, name="duplicate", rank=0),
+        ]
+        with pytest.raises(IntegrityError):
+            await service.bulk_create(items, chunk_size=1)
+        assert await session.get(Widget, 10) is None
+
+    run(check)
+
+
+def test_bulk_create_non_atomic_reports_failed_items():
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        items = [
+            WidgetCreate(id=10, name="new", rank=0),
+            WidgetCreate(id=1, name="duplicate", rank=0),
+            WidgetCreate(id=11, name="new", rank=1),
+        ]
+        result = await service.bulk_create(items, atomic=False)
+        assert [item.success for item in result.detail] == [True, False, True]
+        assert result.detail[1].error
+        assert (result.success_count, result.failure_count) == (2, 1)
+        assert (await session.get(Widget, 11)).name == "new"
+        assert (await session.get(Widget, 1)).name == "widget1"
+
+    run(check)
+
+
+def test_bulk_update_and_delete():
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        # Changed columns go through UPDATE ... FROM (VALUES ...), which SQLite
+        # cannot run; items with nothing to change are only looked up
+        items = [BulkUpdateItem(id=id, data=WidgetUpdate()) for id in (1, 99, 2)]
+        result = await service.bulk_update(items, atomic=False)
+        assert [item.success for item in result.detail] == [True, False, True]
+        assert result.detail[2].detail.name == "widget2"
+        with pytest.raises(NotFoundException):
+            await service.bulk_update(items)
+
+        with pytest.raises(NotFoundException):
+            await service.bulk_delete([3, 99])
+        assert await session.get(Widget, 3) is not None
+
+        result = await service.bulk_delete([3, 99, 4], atomic=False)
+        assert [item.success for item in result.detail] == [True, False, True]
+        assert await session.get(Widget, 4) is None
+
+    run(check)
+
+
+def test_returning_writes():
+    async def check(session):
+        service = QueryService[Widget](session, Widget, returning=True)
+        created = await service.create(WidgetCreate(id=20, name="made", rank=1))
+        assert (created.id, created.version) == (20, 1)
+
+        updated = await service.update(20, WidgetUpdate(name="changed"))
+        assert (updated.name, updated.rank) == ("changed", 1)
+        # Nothing to write still answers with the row
+        unchanged = await service.update(20, WidgetUpdate())
+        assert unchanged.name == "changed"
+        with pytest.raises(NotFoundException):
+            await service.update(99, WidgetUpdate())
+        with pytest.raises(NotFoundException):
+            await service.update(99, WidgetUpdate(name="missing"))
+
+        await service.delete(20)
+        with pytest.raises(NotFoundException):
+            await service.delete(20)
+
+    run(check)
+
+
+def test_read_answers_matching_etag_with_304():
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        etag, response = etag_context()
+        await service.read(1, etag)
+        value = response.headers["ETag"]
+
+        with pytest.raises(NotModifiedException):
+            await service.read(1, etag_context(value)[0])
+
+        # A write bumps the version column, the ETag follows it
+        await session.execute(
+            Widget.__table__.update().where(Widget.id == 1).values(version=2)
+        )
+        etag, response = etag_context(value)
+        await service.read(1, etag)
+        assert response.headers["ETag"] != value
+
+    run(check)
+
+
+def test_list_etag_changes_with_page_content():
+    async def check(session):
+        service = QueryService[Widget](session, Widget)
+        page = PaginationInput(page_index=1, page_size=3)
+        etag, response = etag_context()
+        await service.list(page, WidgetFilter(), etag=etag)
+        value = response.headers["ETag"]
+
+        with pytest.raises(NotModifiedException):
+            await service.list(page, WidgetFilter(), etag=etag_context(value)[0])
+        # Weak validators match too
+        with pytest.raises(NotModifiedException):
+            await service.list(page, WidgetFilter(), etag=etag_context(f"W/{value}")[0])
+
+        etag, response = etag_context(value)
+        await service.list(
+            PaginationInput(page_index=2, page_size=3), WidgetFilter(), etag=etag
+        )
+        assert response.headers["ETag"] != value
+
+    run(check)
+
+
+def test_fieldsets_return_only_requested_fields():
+    async def check(session):
+        service = QueryService[Widget](
+            session, Widget, schema=WidgetRead, fields=["name"]
+        )
+        response = await service.read(2)
+        assert json.loads(response.body) == {"name": "widget2"}
+
+        response = await service.list(
+            PaginationInput(page_index=1, page_size=2), WidgetFilter()
+        )
+        assert json.loads(response.body)["detail"] == [
+            {"name": "widget1"},
+            {"name": "widget2"},
+        ]
+
+        full = QueryService[Widget](session, Widget, schema=WidgetRead)
+        response = await full.read(2)
+        assert json.loads(response.body) == {"id": 2, "name": "widget2", "rank": 2}
+
+    run(check)
+
+
+def test_fieldsets_are_checked_against_the_schema():
+    with pytest.raises(BadRequestException):
+        QueryService[Widget](None, Widget, schema=WidgetRead, fields=["secret"])
+    with pytest.raises(ValueError):
+        QueryService[Widget](None, Widget, fields=["name"])
@@ -0,0 +1,57 @@
+from uuid import uuid4
+import asyncio
+import time
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from authentication import revocation
+from authentication.schema import RevokedToken
+
+
+def revoked(id: int, jti: str) -> RevokedToken:
+    return RevokedToken(id=id, jti=jti, user_id=uuid4(), exp=int(time.time()) + 600)
+
+
+async def check_out_of_order_commits(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all, tables=[RevokedToken.__table__])
+    session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    monkeypatch.setattr(revocation, "async_session", session_maker)
+
+    revocations = revocation.RevocationList()
+    async with session_maker() as session:
+        # Id 2 commits first, id 1 was taken by a slower transaction
+        session.add(revoked(2, "second"))
+        await session.commit()
+    await revocations.refresh()
+    assert revocations.is_revoked("second")
+    assert not revocations.is_revoked("first")
+
+    async with session_maker() as session:
+        session.add(revoked(1, "first"))
+        await session.commit()
+    await revocations.refresh()
+    assert revocations.is_revoked("first")
+
+    # Beyond the lookback window, only the periodic full reload sees it
+    monkeypatch.setattr(revocation.settings, "token_revocation_lookback_ids", 0)
+    async with session_maker() as session:
+        session.add(revoked(1000, "newest"))
+        await session.commit()
+    await revocations.refresh()
+    async with session_maker() as session:
+        session.add(revoked(999, "late"))
+        await session.commit()
+    await revocations.refresh()
+    assert not revocations.is_revoked("late")
+
+    await revocations.refresh(full=True)
+    assert revocations.is_revoked("late")
+    await engine.dispose()
+
+
+def test_refresh_loads_rows_committed_out_of_id_order(monkeypatch):
+    asyncio.run(check_out_of_order_commits(monkeypatch))